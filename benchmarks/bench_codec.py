@@ -0,0 +1,96 @@
+"""
+websocketで送る盤面文字列の変換（to_print_string / from_print_string）のマイクロベンチマーク
+旧実装（セルごとにPythonでループ）と比較し、結果が一致することも確認する
+
+    python benchmarks/bench_codec.py [回数]
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'game'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'client'))
+
+from blocks_duo.Board import Board as GameBoard, EmptyChar, Player1Char, Player2Char  # noqa: E402
+from ss_player.Board import Board as ClientBoard, _CellValues  # noqa: E402
+
+
+def loop_to_print_string(map_) -> str:
+    row_ids = ['1', '2', '3', '4', '5', '6', '7', '8', '9', 'A', 'B', 'C', 'D', 'E']
+
+    ret: list[str] = [f' {"".join(row_ids)}']
+    for row_id, row in zip(row_ids, map_):
+        row_str = ''.join([
+            Player1Char if b == 1 else
+            Player2Char if b == 2 else
+            EmptyChar
+            for b in row])
+        ret.append(f'{row_id}{"".join(row_str)}')
+    return '\n'.join(ret)
+
+
+def loop_from_print_string(board: str):
+    map_ = np.zeros((14, 14), dtype=np.int64)
+    for y, row in enumerate(board.splitlines()[1:]):
+        for x, c in enumerate(row[1:]):
+            if c != EmptyChar:
+                map_[y][x] = 1 if c == Player1Char else 2 if c == Player2Char else 0
+    return map_
+
+
+def lut_parse(board: str):
+    rows = ''.join(board.splitlines()[1:]).encode('ascii')
+    return _CellValues.take(np.frombuffer(rows, dtype=np.uint8).reshape(14, 15)[:, 1:])
+
+
+def game_board(map_) -> GameBoard:
+    board = GameBoard()
+    board.now_board()[:] = map_
+    return board
+
+
+def sample_maps():
+    yield np.zeros((14, 14), dtype=np.int64)
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        yield rng.integers(0, 3, size=(14, 14))
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    maps = list(sample_maps())
+    for map_ in maps:
+        expected = loop_to_print_string(map_)
+        if game_board(map_).to_print_string() != expected:
+            raise AssertionError('to_print_string: result differs from loop implementation')
+        if not np.array_equal(lut_parse(expected), map_) or \
+                not np.array_equal(ClientBoard.from_print_string(expected).now_board(), map_):
+            raise AssertionError('from_print_string: result differs from loop implementation')
+    print(f'{len(maps)} boards: results identical')
+
+    map_ = maps[1]
+    text = loop_to_print_string(map_)
+    cases = {
+        'to_print_string (loop)': lambda: loop_to_print_string(map_),
+        'to_print_string': lambda: game_board(map_).to_print_string(),
+        'parse (loop)': lambda: loop_from_print_string(text),
+        'parse': lambda: lut_parse(text),
+        # 解析に加えてビットボード・合法手の候補・ハッシュも作る
+        'from_print_string': lambda: ClientBoard.from_print_string(text),
+        'round trip (loop parse)': lambda: loop_from_print_string(loop_to_print_string(map_)),
+        'round trip': lambda: ClientBoard.from_print_string(game_board(map_).to_print_string()),
+    }
+    board = game_board(map_)
+    board.to_print_string()
+    cases['to_print_string (cached)'] = board.to_print_string
+
+    for name, case in cases.items():
+        sec = timeit.timeit(case, number=number) / number
+        print(f'{name:>26}: {sec * 1e6:9.1f} us')
+
+
+if __name__ == '__main__':
+    main()
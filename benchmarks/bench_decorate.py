@@ -0,0 +1,137 @@
+"""
+PaddedBlockの角/辺のマスクのマイクロベンチマーク
+旧実装（ブロックを盤面の大きさに広げ、2x2, 1x2窓をPythonでループして印を付ける）と、
+import時にPlacementTableで全ての置き方のマスクを作っておき、PaddedBlockでは引くだけの今の実装
+（ゲーム側・クライアント側のBoard）を比較し、結果が一致することも確認する
+
+    python benchmarks/bench_decorate.py [回数]
+"""
+import os
+import sys
+import time
+import timeit
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'game'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'client'))
+
+from blocks_duo.Board import Board as GameBoard  # noqa: E402
+from blocks_duo.Block import Block  # noqa: E402
+from blocks_duo.BlockRotation import BlockRotation  # noqa: E402
+from blocks_duo.BlockType import BlockType  # noqa: E402
+from blocks_duo.PlacementTable import PlacementTable  # noqa: E402
+from blocks_duo.Position import Position  # noqa: E402
+from ss_player.Board import Board as ClientBoard  # noqa: E402
+
+
+def loop_decorate_corner(map_):
+    corner_lt = np.array([[0, 0], [0, 1]])
+    corner_rt = np.array([[0, 0], [1, 0]])
+    corner_lb = np.array([[0, 1], [0, 0]])
+    corner_rb = np.array([[1, 0], [0, 0]])
+
+    corner_windows = np.lib.stride_tricks.sliding_window_view(map_, [2, 2], writeable=True)
+    for corner_windows_row in corner_windows:
+        for corner_window in corner_windows_row:
+            if np.all(corner_window == corner_lt):
+                corner_window[0, 0] = 2
+            elif np.all(corner_window == corner_rt):
+                corner_window[0, 1] = 2
+            elif np.all(corner_window == corner_lb):
+                corner_window[1, 0] = 2
+            elif np.all(corner_window == corner_rb):
+                corner_window[1, 1] = 2
+
+
+def loop_decorate_edge(map_):
+    edge_left = np.array([[0, 1]])
+    edge_right = np.array([[1, 0]])
+
+    vertical_windows = np.lib.stride_tricks.sliding_window_view(map_, [1, 2], writeable=True)
+    for vertical_windows_row in vertical_windows:
+        for vertical_window in vertical_windows_row:
+            if np.all(vertical_window == edge_left):
+                vertical_window[0, 0] = 3
+            elif np.all(vertical_window == edge_right):
+                vertical_window[0, 1] = 3
+
+    edge_top = np.array([[0], [1]])
+    edge_bottom = np.array([[1], [0]])
+
+    vertical_windows = np.lib.stride_tricks.sliding_window_view(map_, [2, 1], writeable=True)
+    for vertical_windows_row in vertical_windows:
+        for vertical_window in vertical_windows_row:
+            if np.all(vertical_window == edge_top):
+                vertical_window[0, 0] = 3
+            elif np.all(vertical_window == edge_bottom):
+                vertical_window[1, 0] = 3
+
+
+def loop_map(block: Block, position: Position):
+    # 旧実装のPaddedBlockのコンストラクタ
+    map_ = np.pad(block.block_map, ((position.y, 14 - (position.y + block.shape_y)),
+                                    (position.x, 14 - (position.x + block.shape_x))))
+    loop_decorate_corner(map_)
+    loop_decorate_edge(map_)
+    return map_
+
+
+_game_board = GameBoard()
+_client_board = ClientBoard()
+
+IMPLEMENTATIONS = {
+    'loop': loop_map,
+    'game': lambda block, position: GameBoard.PaddedBlock(_game_board, block, position).map,
+    'client': lambda block, position: ClientBoard.PaddedBlock(_client_board, block, position).map,
+}
+
+
+def sample_pieces():
+    # 全ピース・全回転を、盤面の中央と四隅に置いたもの
+    for block_type in BlockType:
+        if block_type == BlockType.X:
+            continue
+        for block_rotation in BlockRotation:
+            block = Block(block_type, block_rotation)
+            for x, y in ((5, 5), (1, 1), (15 - block.shape_x, 1), (1, 15 - block.shape_y),
+                         (15 - block.shape_x, 15 - block.shape_y)):
+                yield block, Position(x, y)
+
+
+def build_table() -> float:
+    # import時と同じ表を作り直すのにかかる時間
+    PlacementTable.blocks.clear()
+    PlacementTable.placements.clear()
+    start = time.perf_counter()
+    PlacementTable._build()
+    return time.perf_counter() - start
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    pieces = list(sample_pieces())
+    for block, position in pieces:
+        expected = loop_map(block, position)
+        for name in ('game', 'client'):
+            if not np.array_equal(IMPLEMENTATIONS[name](block, position), expected):
+                raise AssertionError(f'{name}: result differs from loop implementation')
+    print(f'{len(pieces)} pieces: results identical')
+
+    block, position = Block(BlockType.P, BlockRotation.Rotation_0), Position(5, 5)
+    baseline = None
+    for name, implementation in IMPLEMENTATIONS.items():
+        sec = timeit.timeit(lambda: implementation(block, position), number=number) / number
+        baseline = baseline or sec
+        print(f'{name:>6}: {sec * 1e6:9.1f} us/piece  (x{baseline / sec:.1f})')
+
+    # 表を作る分は、全ての置き方を旧実装で1回ずつ作るのと比べる
+    placements = len(PlacementTable.rows)
+    sec = build_table()
+    print(f' build: {sec * 1e3:9.1f} ms for {placements} placements '
+          f'({sec / placements * 1e6:.1f} us/placement, loop would take {baseline * placements:.1f} s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -5,20 +5,60 @@ from blocks_duo.BlockRotation import BlockRotation
 
 
 class Block:
+    """
+    同じ (BlockType, BlockRotation) のBlockは1つだけ作って使い回す
+    """
 
-    def __init__(self, block_type: BlockType, block_rotation: BlockRotation):
-        self.__block_type = block_type
-        temp_map = block_type.block_map
+    __instances: dict[tuple[BlockType, BlockRotation], 'Block'] = {}
+    __orientations: dict[BlockType, list['Block']] = {}
+
+    def __new__(cls, block_type: BlockType, block_rotation: BlockRotation):
+        block = Block.__instances.get((block_type, block_rotation))
+        if block is None:
+            block = super().__new__(cls)
+            block.__block_type = block_type
+            block.__block_rotation = block_rotation
+            block.__block_map = Block.__rotate(block_type.block_map, block_rotation)
+            Block.__instances[(block_type, block_rotation)] = block
+        return block
+
+    @staticmethod
+    def __rotate(block_map: np.ndarray, block_rotation: BlockRotation) -> np.ndarray:
+        temp_map = block_map
         for _ in range(0, (4 - block_rotation.rotation_count()) % 4):
             temp_map = np.rot90(temp_map)
         if block_rotation.reversed():
             temp_map = np.fliplr(temp_map)
-        self.__block_map = temp_map
+        temp_map = np.ascontiguousarray(temp_map)
+        temp_map.setflags(write=False)
+        return temp_map
+
+    @staticmethod
+    def orientations(block_type: BlockType) -> list['Block']:
+        """
+        回転・反転して形が重複しないBlockだけ（BlockRotationの小さい方を残す）
+        """
+        orientations = Block.__orientations.get(block_type)
+        if orientations is None:
+            orientations = []
+            for block_rotation in BlockRotation:
+                block = Block(block_type, block_rotation)
+                if not any(np.array_equal(block.block_map, b.block_map) for b in orientations):
+                    orientations.append(block)
+            Block.__orientations[block_type] = orientations
+        return orientations
+
+    def __reduce__(self):
+        return Block, (self.__block_type, self.__block_rotation)
 
     @property
     def block_type(self) -> BlockType:
         return self.__block_type
 
+    @property
+    def block_rotation(self) -> BlockRotation:
+        return self.__block_rotation
+
     @property
     def block_map(self):
         return self.__block_map
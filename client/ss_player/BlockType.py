@@ -30,182 +30,122 @@ class BlockType(Enum):
 
     @property
     def block_map(self) -> np.ndarray[Any, np.dtype[int]]:
-        if self == BlockType.A:
-            ''' 
-            type A:
-             ■ 
-            '''
-            return np.array([[1]])
-        elif self == BlockType.B:
-            ''' 
-            type B:
-             ■ 
-             ■ 
-            '''
-            return np.array([[1], [1]])
-        elif self == BlockType.C:
-            '''
-            type C:
-             ■ 
-             ■ 
-             ■ 
-            '''
-            return np.array([[1], [1], [1]])
-        elif self == BlockType.D:
-            '''
-            type D:
-             ■ 
-             ■ ■ 
-            '''
-            return np.array([[1, 0], [1, 1]])
-        elif self == BlockType.E:
-            '''
-            type E:
-             ■ 
-             ■ 
-             ■ 
-             ■ 
-            '''
-            return np.array([[1], [1], [1], [1]])
-        elif self == BlockType.F:
-            '''
-            type F:
-               ■ 
-               ■ 
-             ■ ■ 
-            '''
-            return np.array([[0, 1], [0, 1], [1, 1]])
-        elif self == BlockType.G:
-            '''
-            type G:
-             ■ 
-             ■ ■ 
-             ■    
-            '''
-            return np.array([[1, 0], [1, 1], [1, 0]])
-        elif self == BlockType.H:
-            '''
-            type H:
-             ■ ■ 
-             ■ ■ 
-            '''
-            return np.array([[1, 1], [1, 1]])
-        elif self == BlockType.I:
-            '''
-            type I:
-             ■ ■ 
-               ■ ■ 
-            '''
-            return np.array([[1, 1, 0], [0, 1, 1]])
-        elif self == BlockType.J:
-            '''
-            type J:
-             ■ 
-             ■ 
-             ■ 
-             ■ 
-             ■ 
-            '''
-            return np.array([[1], [1], [1], [1], [1]])
-        elif self == BlockType.K:
-            '''
-            type K:
-               ■ 
-               ■ 
-               ■ 
-             ■ ■ 
-            '''
-            return np.array([[0, 1], [0, 1], [0, 1], [1, 1]])
-        elif self == BlockType.L:
-            '''
-            type L:
-               ■ 
-               ■ 
-             ■ ■ 
-             ■ 
-            '''
-            return np.array([[0, 1], [0, 1], [1, 1], [1, 0]])
-        elif self == BlockType.M:
-            '''
-            type M:
-               ■ 
-             ■ ■ 
-             ■ ■ 
-            '''
-            return np.array([[0, 1], [1, 1], [1, 1]])
-        elif self == BlockType.N:
-            '''
-            type N:
-             ■ ■ 
-               ■ 
-             ■ ■ 
-            '''
-            return np.array([[1, 1], [0, 1], [1, 1]])
-        elif self == BlockType.O:
-            '''
-            type O:
-             ■ 
-             ■ ■ 
-             ■ 
-             ■ 
-            '''
-            return np.array([[1, 0], [1, 1], [1, 0], [1, 0]])
-        elif self == BlockType.P:
-            '''
-            type P:
-               ■ 
-               ■ 
-             ■ ■ ■ 
-            '''
-            return np.array([[0, 1, 0], [0, 1, 0], [1, 1, 1]])
-        elif self == BlockType.Q:
-            '''
-            type Q:
-             ■ 
-             ■ 
-             ■ ■ ■ 
-            '''
-            return np.array([[1, 0, 0], [1, 0, 0], [1, 1, 1]])
-        elif self == BlockType.R:
-            '''
-            type R:
-             ■ ■ 
-               ■ ■ 
-                 ■ 
-            '''
-            return np.array([[1, 1, 0], [0, 1, 1], [0, 0, 1]])
-        elif self == BlockType.S:
-            '''
-            type S:
-             ■ 
-             ■ ■ ■ 
-                 ■ 
-            '''
-            return np.array([[1, 0, 0], [1, 1, 1], [0, 0, 1]])
-        elif self == BlockType.T:
-            '''
-            type T:
-             ■ 
-             ■ ■ ■ 
-               ■ 
-            '''
-            return np.array([[1, 0, 0], [1, 1, 1], [0, 1, 0]])
-        elif self == BlockType.U:
-            '''
-            type U:
-               ■ 
-             ■ ■ ■ 
-               ■ 
-            '''
-            return np.array([[0, 1, 0], [1, 1, 1], [0, 1, 0]])
-        elif self == BlockType.X:
-            '''
-            type X:パスをする時用
-                 
-                   
-                 
-            '''
-            return np.array([[0, 0, 0], [0, 0, 0], [0, 0, 0]])
-        
-        else:
-            raise NotImplementedError
+        """
+        回転前の形（読み取り専用、全体で共有）
+        """
+        return BlockMaps[self]
+
+
+# BlockTypeごとの回転前の形
+BlockMaps: dict[BlockType, np.ndarray] = {}
+
+# type A:
+#  ■
+BlockMaps[BlockType.A] = np.array([[1]])
+# type B:
+#  ■
+#  ■
+BlockMaps[BlockType.B] = np.array([[1], [1]])
+# type C:
+#  ■
+#  ■
+#  ■
+BlockMaps[BlockType.C] = np.array([[1], [1], [1]])
+# type D:
+#  ■
+#  ■ ■
+BlockMaps[BlockType.D] = np.array([[1, 0], [1, 1]])
+# type E:
+#  ■
+#  ■
+#  ■
+#  ■
+BlockMaps[BlockType.E] = np.array([[1], [1], [1], [1]])
+# type F:
+#    ■
+#    ■
+#  ■ ■
+BlockMaps[BlockType.F] = np.array([[0, 1], [0, 1], [1, 1]])
+# type G:
+#  ■
+#  ■ ■
+#  ■
+BlockMaps[BlockType.G] = np.array([[1, 0], [1, 1], [1, 0]])
+# type H:
+#  ■ ■
+#  ■ ■
+BlockMaps[BlockType.H] = np.array([[1, 1], [1, 1]])
+# type I:
+#  ■ ■
+#    ■ ■
+BlockMaps[BlockType.I] = np.array([[1, 1, 0], [0, 1, 1]])
+# type J:
+#  ■
+#  ■
+#  ■
+#  ■
+#  ■
+BlockMaps[BlockType.J] = np.array([[1], [1], [1], [1], [1]])
+# type K:
+#    ■
+#    ■
+#    ■
+#  ■ ■
+BlockMaps[BlockType.K] = np.array([[0, 1], [0, 1], [0, 1], [1, 1]])
+# type L:
+#    ■
+#    ■
+#  ■ ■
+#  ■
+BlockMaps[BlockType.L] = np.array([[0, 1], [0, 1], [1, 1], [1, 0]])
+# type M:
+#    ■
+#  ■ ■
+#  ■ ■
+BlockMaps[BlockType.M] = np.array([[0, 1], [1, 1], [1, 1]])
+# type N:
+#  ■ ■
+#    ■
+#  ■ ■
+BlockMaps[BlockType.N] = np.array([[1, 1], [0, 1], [1, 1]])
+# type O:
+#  ■
+#  ■ ■
+#  ■
+#  ■
+BlockMaps[BlockType.O] = np.array([[1, 0], [1, 1], [1, 0], [1, 0]])
+# type P:
+#    ■
+#    ■
+#  ■ ■ ■
+BlockMaps[BlockType.P] = np.array([[0, 1, 0], [0, 1, 0], [1, 1, 1]])
+# type Q:
+#  ■
+#  ■
+#  ■ ■ ■
+BlockMaps[BlockType.Q] = np.array([[1, 0, 0], [1, 0, 0], [1, 1, 1]])
+# type R:
+#  ■ ■
+#    ■ ■
+#      ■
+BlockMaps[BlockType.R] = np.array([[1, 1, 0], [0, 1, 1], [0, 0, 1]])
+# type S:
+#  ■
+#  ■ ■ ■
+#      ■
+BlockMaps[BlockType.S] = np.array([[1, 0, 0], [1, 1, 1], [0, 0, 1]])
+# type T:
+#  ■
+#  ■ ■ ■
+#    ■
+BlockMaps[BlockType.T] = np.array([[1, 0, 0], [1, 1, 1], [0, 1, 0]])
+# type U:
+#    ■
+#  ■ ■ ■
+#    ■
+BlockMaps[BlockType.U] = np.array([[0, 1, 0], [1, 1, 1], [0, 1, 0]])
+# type X:パスをする時用
+BlockMaps[BlockType.X] = np.array([[0, 0, 0], [0, 0, 0], [0, 0, 0]])
+
+for _map in BlockMaps.values():
+    _map.setflags(write=False)
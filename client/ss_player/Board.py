@@ -1,19 +1,49 @@
 from __future__ import annotations
+from typing import Optional
+
 import numpy as np
 
+from blocks_duo.BitBoard import BitBoard
 from blocks_duo.Block import Block
+from blocks_duo.PlacementTable import Placement, PlacementTable, Pieces
 from blocks_duo.Player import Player
 from blocks_duo.Position import Position
+from blocks_duo.Zobrist import Zobrist
 
 EmptyChar = '.'
 Player1Char = 'o'
 Player2Char = 'x'
 
+RowIds = '123456789ABCDE'
+# セルの値 -> 文字 / 文字コード -> セルの値 の変換表
+_CellChars = np.frombuffer(f'{EmptyChar}{Player1Char}{Player2Char}'.encode('ascii'), dtype=np.uint8)
+_CellValues = np.zeros(256, dtype=np.int64)
+_CellValues[ord(Player1Char)] = 1
+_CellValues[ord(Player2Char)] = 2
+
+# 初手で必ず覆う必要があるセル
+StartBits = {1: BitBoard.bit(4, 4), 2: BitBoard.bit(9, 9)}
+
 
 class Board:
     def __init__(self):
         self.__board = np.zeros((14, 14), dtype=np.int64)
-        pass
+        # __boardを書き換えるたびに進める（to_print_stringのキャッシュ用）
+        self.__version = 0
+        self.__printed: tuple[int, str] = (-1, '')
+        # プレイヤー番号ごとの占有セル（ビットボード）、0番は未使用
+        self.__occupancy = [0, 0, 0]
+        # 置くと反則になるセル（埋まっている or 自分のブロックと辺で接する）
+        self.__forbidden = [0, 0, 0]
+        # 次に置くブロックが覆うべきセル（自分のブロックと角で接する空きセル）
+        self.__anchors = [0, 0, 0]
+        # プレイヤー番号ごとの置いたセル数
+        self.__points = [0, 0, 0]
+        # 盤面・使用済みブロック・手番のZobristハッシュ
+        self.__hash = 0
+        self.__side_to_move = 1
+        # make_move/make_passの取り消し用
+        self.__history: list[tuple] = []
 
     def now_board(self):
         """
@@ -22,6 +52,30 @@ class Board:
         """
         return self.__board
 
+    def anchors(self, player: Player) -> int:
+        return self.__anchors[player.player_number]
+
+    def forbidden(self, player: Player) -> int:
+        return self.__forbidden[player.player_number]
+
+    @property
+    def zobrist_hash(self) -> int:
+        return self.__hash
+
+    def position_key(self, side_to_move: int) -> int:
+        """
+        サーバのBoard.position_keyと同じ、盤面のセルと手番だけから作る局面のキー（定跡を引く用）
+        """
+        return Zobrist.position_key(Zobrist.board_key(self.__board), side_to_move)
+
+    @property
+    def side_to_move(self) -> int:
+        return self.__side_to_move
+
+    @property
+    def version(self) -> int:
+        return self.__version
+
     @property
     def shape_x(self) -> int:
         return self.__board.shape[1]
@@ -32,9 +86,9 @@ class Board:
 
     def get_point(self, player: Player) -> int:
         score = 0
-        if len(player.usable_blocks()) == 0:
+        if player.all_used:
             score += 20
-        score += len(self.__board[self.__board == player.player_number])
+        score += self.__points[player.player_number]
         return score
 
     def try_place_first_block(self, player: Player, block: Block, position: Position):
@@ -60,135 +114,207 @@ class Board:
     def can_place(self, player: Player, padded_block: PaddedBlock, first=False) -> bool:
         if first:
             return self.can_place_first_block(player, padded_block)
-        if self.detect_collision(padded_block):
+        if padded_block.bits & self.__forbidden[player.player_number]:
             return False
-        if self.detect_side_connection(player, padded_block):
-            return False
-        return self.detect_corner_connection(player, padded_block)
+        return (padded_block.bits & self.__anchors[player.player_number]) != 0
 
     def can_place_first_block(self, player: Player, padded_block: PaddedBlock) -> bool:
-        if player.player_number == 1 and padded_block.block_map[4, 4] == 1:
-            return True
-        if player.player_number == 2 and padded_block.block_map[9, 9] == 1:
-            return True
-        return False
-
-    def detect_collision(self, padded_block: PaddedBlock) -> bool:
-        collision_map = padded_block.block_map
-        return self.__board.flatten().dot(collision_map.flatten()) > 0
-
-    def detect_side_connection(self, player: Player, padded_block: PaddedBlock) -> bool:
-        edge_map = padded_block.edge_map
-        player_block_map = np.zeros(self.__board.shape, dtype=np.int64)
-        player_block_map[self.__board == player.player_number] = 1
-        return player_block_map.flatten().dot(edge_map.flatten()) > 0
-
-    def detect_corner_connection(self, player: Player, padded_block: PaddedBlock) -> bool:
-        corner_map = padded_block.corner_map
-        player_block_map = np.zeros(self.__board.shape, dtype=np.int64)
-        player_block_map[self.__board == player.player_number] = 1
-        return player_block_map.flatten().dot(corner_map.flatten()) > 0
+        return (padded_block.bits & StartBits[player.player_number]) != 0
+
+    def legal_moves(self, player: Player, usable_blocks, first=False) -> np.ndarray:
+        """
+        置ける手を全て (piece, rotation, x, y) の行の配列で返す
+        pieceはPlacementTable.Piecesでのインデックス、x, yはPositionに渡す1始まりの座標
+        :return: shape (手の数, 4) のint8配列
+        """
+        table = PlacementTable
+        if first:
+            # 初手は開始位置を覆うかだけを見る
+            rows = table.covering_rows(BitBoard.cells(StartBits[player.player_number]))
+            return table.moves[rows[table.piece_mask(usable_blocks)[table.moves[rows, 0]]]]
+
+        anchors = self.__anchors[player.player_number]
+        if not anchors:
+            return table.moves[:0]
+        rows = table.covering_rows(BitBoard.cells(anchors))
+        rows = rows[table.piece_mask(usable_blocks)[table.moves[rows, 0]]]
+        forbidden = BitBoard.to_words(self.__forbidden[player.player_number])
+        return table.moves[rows[~(table.block_words[rows] & forbidden).any(axis=1)]]
 
     def place_block(self, player: Player, padded_block: PaddedBlock):
-        self.__board += padded_block.block_map * player.player_number
+        self.__put(player.player_number, padded_block.placement)
 
     def remove_block(self, player: Player, padded_block: PaddedBlock):
-        self.__board -= padded_block.block_map * player.player_number
+        n = player.player_number
+        placement = padded_block.placement
+        self.__occupancy[n] &= ~placement.bits
+        np.put(self.__board, placement.cells, 0)
+        self.__version += 1
+        self.__points[n] -= len(placement.cells)
+        self.__hash ^= Zobrist.placement_key(n, placement.row)
+        self.__refresh_frontier()
+
+    def make_move(self, player: Player, move):
+        """
+        探索用に手 (piece, rotation, x, y) を指す（合法かどうかは確認しない）
+        playerの使用済みブロック・得点・ハッシュ・手番も更新し、unmake_moveで元に戻せる
+        """
+        piece, rotation, x, y = move
+        placement = PlacementTable.placement_of(piece, rotation, x, y)
+        n = player.player_number
+        self.__push_history(player, placement)
+        player.use_block(placement.block)
+        self.__put(n, placement)
+        self.__hash ^= Zobrist.piece_key(n, piece)
+        self.__set_side_to_move(3 - n)
+
+    def make_pass(self, player: Player):
+        self.__push_history(player, None)
+        self.__set_side_to_move(3 - player.player_number)
+
+    def unmake_move(self):
+        player, placement, anchors, forbidden, side_to_move, hash_ = self.__history.pop()
+        if placement is not None:
+            n = player.player_number
+            self.__occupancy[n] &= ~placement.bits
+            np.put(self.__board, placement.cells, 0)
+            self.__version += 1
+            self.__points[n] -= len(placement.cells)
+            player.unuse_block(placement.block)
+        self.__anchors[1], self.__anchors[2] = anchors
+        self.__forbidden[1], self.__forbidden[2] = forbidden
+        self.__side_to_move = side_to_move
+        self.__hash = hash_
+
+    def init_hash(self, side_to_move: int, players=()):
+        """
+        盤面からハッシュを計算し直す
+        playersを渡すと、そのプレイヤーの使用済みブロックもハッシュに含める
+        """
+        self.__hash = Zobrist.board_key(self.__board)
+        for player in players:
+            usable = {b.value for b in player.usable_blocks()}
+            for piece, block_type in enumerate(Pieces):
+                if block_type not in usable:
+                    self.__hash ^= Zobrist.piece_key(player.player_number, piece)
+        self.__side_to_move = 1
+        self.__set_side_to_move(side_to_move)
+
+    def __push_history(self, player: Player, placement: Optional[Placement]):
+        self.__history.append((player, placement,
+                               (self.__anchors[1], self.__anchors[2]),
+                               (self.__forbidden[1], self.__forbidden[2]),
+                               self.__side_to_move, self.__hash))
+
+    def __set_side_to_move(self, side_to_move: int):
+        if side_to_move != self.__side_to_move:
+            self.__hash ^= Zobrist.side
+            self.__side_to_move = side_to_move
+
+    def __put(self, n: int, placement: Placement):
+        bits = placement.bits
+        self.__occupancy[n] |= bits
+        np.put(self.__board, placement.cells, n)
+        self.__version += 1
+        self.__points[n] += len(placement.cells)
+        self.__hash ^= Zobrist.placement_key(n, placement.row)
+
+        self.__forbidden[n] |= bits | BitBoard.edge_neighbours(bits)
+        self.__anchors[n] = (self.__anchors[n] | BitBoard.corner_neighbours(bits)) & ~self.__forbidden[n]
+        self.__forbidden[3 - n] |= bits
+        self.__anchors[3 - n] &= ~bits
+
+    def __refresh_frontier(self):
+        occupied = self.__occupancy[1] | self.__occupancy[2]
+        for n in (1, 2):
+            own = self.__occupancy[n]
+            self.__forbidden[n] = occupied | BitBoard.edge_neighbours(own)
+            self.__anchors[n] = BitBoard.corner_neighbours(own) & ~self.__forbidden[n]
 
     def to_print_string(self) -> str:
-        row_ids = ['1', '2', '3', '4', '5', '6', '7', '8', '9', 'A', 'B', 'C', 'D', 'E']
-
-        ret: list[str] = [f' {"".join(row_ids)}']
-        for row_id, row in zip(row_ids, self.__board):
-            row_str = ''.join([
-                Player1Char if b == 1 else
-                Player2Char if b == 2 else
-                EmptyChar
-                for b in row])
-            ret.append(f'{row_id}{"".join(row_str)}')
-        return '\n'.join(ret)
+        """
+        websocketで送る盤面の文字列（同じversionの間は前回の文字列を使い回す）
+        """
+        version, printed = self.__printed
+        if version != self.__version:
+            rows = np.empty((14, 16), dtype=np.uint8)
+            rows[:, 0] = np.frombuffer(RowIds.encode('ascii'), dtype=np.uint8)
+            rows[:, 1:15] = _CellChars.take(self.__board)
+            rows[:, 15] = ord('\n')
+            printed = f' {RowIds}\n' + rows.tobytes()[:-1].decode('ascii')
+            self.__printed = (self.__version, printed)
+        return printed
 
     @staticmethod
     def from_print_string(board: str) -> Board:
         ret = Board()
-        for y, row in enumerate(board.splitlines()[1:]):
-            for x, c in enumerate(row[1:]):
-                if c != EmptyChar:
-                    ret.__board[y][x] = 1 if c == Player1Char else 2 if c == Player2Char else 0
+        rows = ''.join(board.splitlines()[1:15]).encode('ascii')
+        ret.__board = _CellValues.take(np.frombuffer(rows, dtype=np.uint8).reshape(14, 15)[:, 1:])
+        ret.__occupancy = [0, BitBoard.from_map(ret.__board == 1), BitBoard.from_map(ret.__board == 2)]
+        ret.__points = [0, BitBoard.count(ret.__occupancy[1]), BitBoard.count(ret.__occupancy[2])]
+        ret.__refresh_frontier()
+        ret.init_hash(1)
         return ret
 
+    @staticmethod
+    def parse_status(board: str) -> dict[str, list[str]]:
+        """
+        盤面の後ろに付いている拡張の行（例: "clock 12.5 30.0 10.0"）を {"clock": ["12.5", "30.0", "10.0"]} にする
+        """
+        ret = {}
+        for line in board.splitlines()[15:]:
+            key, *values = line.split()
+            ret[key] = values
+        return ret
+
+    @staticmethod
+    def status_moves(status: dict[str, list[str]]) -> Optional[np.ndarray]:
+        """
+        moves拡張の行があれば、サーバが送ってきた置ける手を legal_moves と同じ形の配列にして返す
+        :return: 行がなければNone
+        """
+        actions = status.get('moves')
+        if actions is None:
+            return None
+        return PlacementTable.parse_actions(actions)
+
     class PaddedBlock:
 
         def __init__(self, board: Board, block: Block, position: Position):
-            pad_top = position.y
-            pad_bottom = board.shape_y - (position.y + block.shape_y)
-            pad_left = position.x
-            pad_right = board.shape_x - (position.x + block.shape_x)
-            self.__map = np.pad(block.block_map, ((pad_top, pad_bottom), (pad_left, pad_right)))
-            self._decorate_corner(self.__map)
-            self._decorate_edge(self.__map)
-
-        @staticmethod
-        def _decorate_corner(map_):
-            corner_lt = np.array([[0, 0], [0, 1]])
-            corner_rt = np.array([[0, 0], [1, 0]])
-            corner_lb = np.array([[0, 1], [0, 0]])
-            corner_rb = np.array([[1, 0], [0, 0]])
-
-            corner_windows = np.lib.stride_tricks.sliding_window_view(map_, [2, 2], writeable=True)
-            for corner_windows_row in corner_windows:
-                for corner_window in corner_windows_row:
-                    if np.all(corner_window == corner_lt):
-                        corner_window[0, 0] = 2
-                    elif np.all(corner_window == corner_rt):
-                        corner_window[0, 1] = 2
-                    elif np.all(corner_window == corner_lb):
-                        corner_window[1, 0] = 2
-                    elif np.all(corner_window == corner_rb):
-                        corner_window[1, 1] = 2
-
-        @staticmethod
-        def _decorate_edge(map_):
-            edge_left = np.array([[0, 1]])
-            edge_right = np.array([[1, 0]])
-
-            vertical_windows = np.lib.stride_tricks.sliding_window_view(map_, [1, 2], writeable=True)
-            for vertical_windows_row in vertical_windows:
-                for vertical_window in vertical_windows_row:
-                    if np.all(vertical_window == edge_left):
-                        vertical_window[0, 0] = 3
-                    elif np.all(vertical_window == edge_right):
-                        vertical_window[0, 1] = 3
-
-            edge_top = np.array([[0], [1]])
-            edge_bottom = np.array([[1], [0]])
-
-            vertical_windows = np.lib.stride_tricks.sliding_window_view(map_, [2, 1], writeable=True)
-            for vertical_windows_row in vertical_windows:
-                for vertical_window in vertical_windows_row:
-                    if np.all(vertical_window == edge_top):
-                        vertical_window[0, 0] = 3
-                    elif np.all(vertical_window == edge_bottom):
-                        vertical_window[1, 0] = 3
+            self.__placement = PlacementTable.lookup(block, position)
+
+        @property
+        def placement(self) -> Placement:
+            return self.__placement
 
         @property
         def map(self):
-            return self.__map
+            return self.block_map + self.corner_map * 2 + self.edge_map * 3
+
+        @property
+        def bits(self) -> int:
+            return self.__placement.bits
+
+        @property
+        def edge_bits(self) -> int:
+            return self.__placement.edge_bits
+
+        @property
+        def corner_bits(self) -> int:
+            return self.__placement.corner_bits
+
+        @property
+        def cells(self) -> tuple[int, ...]:
+            return self.__placement.cells
 
         @property
         def block_map(self):
-            map_ = np.zeros(self.__map.shape, dtype=np.int64)
-            map_[self.__map == 1] = 1
-            return map_
+            return BitBoard.to_map(self.__placement.bits)
 
         @property
         def edge_map(self):
-            map_ = np.zeros(self.__map.shape, dtype=np.int64)
-            map_[self.__map == 3] = 1
-            return map_
+            return BitBoard.to_map(self.__placement.edge_bits)
 
         @property
         def corner_map(self):
-            map_ = np.zeros(self.__map.shape, dtype=np.int64)
-            map_[self.__map == 2] = 1
-            return map_
+            return BitBoard.to_map(self.__placement.corner_bits)
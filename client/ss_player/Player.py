@@ -5,19 +5,26 @@ from websockets import WebSocketServerProtocol
 from blocks_duo.Block import Block
 from blocks_duo.BlockRotation import BlockRotation
 from blocks_duo.BlockType import BlockType
+from blocks_duo.PlacementTable import PlacementTable
 from blocks_duo.Position import Position
 
 if TYPE_CHECKING:
     from Board import Board
     from blocks_duo.BattleRecord import BattleRecord
 
+# 持ち駒のビット（BlockTypeの並び順）
+PieceBits = {b.value: 1 << i for i, b in enumerate(BlockType)}
+AllPieces = (1 << len(PieceBits)) - 1
+# パス用のXは使い切りの判定に含めない
+PlacablePieces = AllPieces & ~PieceBits[BlockType.X.value]
+
 
 class Player:
     def __init__(self, player_number: int, target: str, player_name: str, connection: WebSocketServerProtocol):
         self.__target = target
         self.__player_name = player_name
         self.__player_number = player_number
-        self.__usable_blocks = {b for b in BlockType}
+        self.__usable_pieces = AllPieces
         self.__connection = connection
         self.__active = True
         self.__record: Optional[BattleRecord] = None
@@ -60,27 +67,43 @@ class Player:
         if self.__record:
             self.__record.add_record(self, player_request)
 
-        block_type = player_request[0]
-        block_rotation = int(player_request[1])
+        block_type = BlockType(player_request[0])
+        block_rotation = BlockRotation(int(player_request[1]))
         position_x = int(player_request[2], 16)
         position_y = int(player_request[3], 16)
-        return Block(BlockType(block_type), BlockRotation(block_rotation)), Position(position_x, position_y)
+        return PlacementTable.block(block_type.value, block_rotation.value), Position(position_x, position_y)
 
     def can_use_block(self, block: Block) -> bool:
-        return block.block_type in self.__usable_blocks
+        return (self.__usable_pieces & PieceBits[block.block_type.value]) != 0
 
     def use_block(self, block: Block):
-        if block.block_type not in self.__usable_blocks:
+        bit = PieceBits[block.block_type.value]
+        if not self.__usable_pieces & bit:
             raise ValueError("passed block is not usable.")
-        self.__usable_blocks.remove(block.block_type)
+        self.__usable_pieces &= ~bit
 
     def unuse_block(self, block: Block):
-        if block.block_type in self.__usable_blocks:
+        bit = PieceBits[block.block_type.value]
+        if self.__usable_pieces & bit:
             raise ValueError("passed block is already usable.")
-        self.__usable_blocks.add(block.block_type)
+        self.__usable_pieces |= bit
+
+    @property
+    def usable_pieces(self) -> int:
+        """
+        使えるブロックのビットマスク（PieceBits）
+        """
+        return self.__usable_pieces
+
+    @property
+    def all_used(self) -> bool:
+        """
+        パス以外のブロックを全て使い切ったか
+        """
+        return (self.__usable_pieces & PlacablePieces) == 0
 
-    def usable_blocks(self) -> set[BlockType]:
-        return self.__usable_blocks
+    def usable_blocks(self) -> list[BlockType]:
+        return [b for b in BlockType if self.__usable_pieces & PieceBits[b.value]]
 
-    def used_blocks(self) -> set[BlockType]:
-        return {b for b in BlockType} - self.__usable_blocks
+    def used_blocks(self) -> list[BlockType]:
+        return [b for b in BlockType if not self.__usable_pieces & PieceBits[b.value]]
@@ -0,0 +1,74 @@
+from __future__ import annotations
+import asyncio
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import websockets
+
+PersistentFeature = 'persistent'
+
+
+class Session:
+    """
+    1つの接続で複数の対戦を行うためのPlayerClientのラッパー
+    サーバから席番号（例: "2 persistent"）が届くたびに新しい対戦を始める
+    PlayerClientにnew_game(player_number)があれば同じインスタンスを使い続け、なければ作り直す
+    要求するプロトコル拡張は PlayerClient.features（なければ persistent のみ）
+    """
+
+    def __init__(self, client_class, socket: websockets.WebSocketClientProtocol, loop: asyncio.AbstractEventLoop):
+        self.__client_class = client_class
+        self.__socket = socket
+        self.__loop = loop
+        self.__client = None
+        self.__features: set[str] = set()
+
+    @property
+    def features(self) -> set[str]:
+        """
+        サーバが受け入れたプロトコル拡張
+        """
+        return self.__features
+
+    @staticmethod
+    async def create(client_class, url: str, loop: asyncio.AbstractEventLoop) -> Session:
+        features = getattr(client_class, 'features', (PersistentFeature,))
+        socket = await websockets.connect(Session.feature_url(url, features))
+        print('Session: connected')
+        return Session(client_class, socket, loop)
+
+    @staticmethod
+    def feature_url(url: str, features) -> str:
+        parts = urlsplit(url)
+        query = parse_qsl(parts.query) + [('features', ','.join(features))]
+        return urlunsplit(parts._replace(query=urlencode(query, safe=',')))
+
+    async def close(self):
+        await self.__socket.close()
+
+    async def play(self):
+        while True:
+            try:
+                message = await self.__socket.recv()
+            except websockets.ConnectionClosed:
+                # persistentな接続は、サーバが対戦を全て終えると閉じられる
+                return
+
+            if message[:1].isdigit():
+                self.new_game(message)
+                continue
+
+            action = self.__client.create_action(message)
+            await self.__socket.send(action)
+            if action == 'X000' and PersistentFeature not in self.__features:
+                return
+
+    def new_game(self, message: str):
+        number, _, features = message.partition(' ')
+        player_number = int(number)
+        self.__features = set(features.split(',')) if features else set()
+        print(f'player_number: {player_number}')
+
+        if self.__client is not None and hasattr(self.__client, 'new_game'):
+            self.__client.new_game(player_number)
+        else:
+            self.__client = self.__client_class(player_number, self.__socket, self.__loop)
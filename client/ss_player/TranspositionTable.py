@@ -0,0 +1,75 @@
+from __future__ import annotations
+from collections import OrderedDict
+from enum import IntEnum
+from itertools import islice
+from typing import NamedTuple, Optional
+
+# 1エントリあたりのおおよそのメモリ使用量（OrderedDictのノード + タプル + int）
+ENTRY_BYTES = 240
+# 満杯のとき、古い方からこの数だけ見て一番浅いエントリを追い出す
+EVICTION_WINDOW = 4
+
+
+class Bound(IntEnum):
+    exact = 0
+    lower = 1
+    upper = 2
+
+
+class TranspositionEntry(NamedTuple):
+    depth: int
+    value: float
+    bound: Bound
+    best_move: Optional[list[int]]
+
+
+class TranspositionTable:
+    """
+    Board.zobrist_hashをキーにした置換表
+    同じキーは深さ優先で上書きし、満杯のときは最近使われていないエントリから追い出す
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.__capacity = max(1, max_bytes // ENTRY_BYTES)
+        self.__entries: OrderedDict[int, TranspositionEntry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.__capacity
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def probe(self, key: int) -> Optional[TranspositionEntry]:
+        entry = self.__entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__entries.move_to_end(key)
+        return entry
+
+    def store(self, key: int, depth: int, value: float, bound: Bound, best_move: Optional[list[int]]):
+        entry = self.__entries.get(key)
+        if entry is not None:
+            self.__entries.move_to_end(key)
+            if entry.depth > depth:
+                return
+        elif len(self.__entries) >= self.__capacity:
+            oldest = islice(self.__entries.items(), EVICTION_WINDOW)
+            victim = min(oldest, key=lambda item: item[1].depth)[0]
+            del self.__entries[victim]
+            self.evictions += 1
+        self.__entries[key] = TranspositionEntry(depth, value, bound, best_move)
+        self.stores += 1
+
+    def clear(self):
+        self.__entries.clear()
+
+    def stats(self) -> str:
+        return (f'tt: {len(self.__entries)}/{self.__capacity} entries, '
+                f'{self.hits} hits, {self.misses} misses, {self.evictions} evictions')
@@ -7,6 +7,7 @@ import sys
 from ss_player.mnaito_client2 import PlayerClient
 # from ss_player.rnishi_client import PlayerClient
 #from ss_player.snara_client import PlayerClient
+from ss_player.Session import Session
 
 
 def main():
@@ -14,9 +15,11 @@ def main():
     loop = asyncio.new_event_loop()
     print(f'client start : {server_url}')
     asyncio.set_event_loop(loop)
-    client: PlayerClient = loop.run_until_complete(PlayerClient.create(server_url, loop))
+    # 1つの接続・プロセスで複数の対戦を行う（サーバが対応していなければ1対戦で終わる）
+    client = loop.run_until_complete(Session.create(PlayerClient, server_url, loop))
     try:
         loop.run_until_complete(client.play())
+        loop.run_until_complete(client.close())
     except KeyboardInterrupt:
         loop.run_until_complete(client.close())
         loop.close()
@@ -1,19 +1,31 @@
 from __future__ import annotations
 import asyncio
+import time
 import websockets
 
 from .Board import Board
 from .Player import Player
-from .Position import Position
-from .Block import Block
-from .BlockType import BlockType
-from .BlockRotation import BlockRotation
+from blocks_duo.PlacementTable import PlacementTable
+from .TranspositionTable import TranspositionTable, Bound
 
 import random
 import numpy as np
 
 
+class SearchTimeout(Exception):
+    """
+    探索中にtime_limitを過ぎた
+    """
+
+
 class PlayerClient:
+    # 探索する手数（自分の手を1手目として数える）。1手ずつ深くして、時間内に読めた一番深い結果を使う
+    search_depth = 3
+    # 1手に使う時間の上限（秒）。超えたら読み終えたところまでの最善手を返す
+    time_limit = 8.0
+    # 置換表のメモリ上限
+    tt_max_bytes = 32 * 1024 * 1024
+
     def __init__(self, player_number: int, socket: websockets.WebSocketClientProtocol, loop: asyncio.AbstractEventLoop):
         self._loop = loop
         self._socket = socket
@@ -23,6 +35,9 @@ class PlayerClient:
         self._board = Board()
         self._player = Player(player_number, "pl", "player", None)
         self._opponent = Player(3 - player_number, "op", "opponent", None)
+        self._tt = TranspositionTable(self.tt_max_bytes)
+        # この手の探索を打ち切る時刻（time.perf_counter）
+        self._deadline = float('inf')
 
     @property
     def player_number(self) -> int:
@@ -41,41 +56,64 @@ class PlayerClient:
 
     def create_action(self, board):
         self._board = Board.from_print_string(board)
+        self._board.init_hash(self.player_number, [self._player, self._opponent])
 
-        inf = float('inf')
-        best_score = -inf
         best_action = 'X000'
-
-        for shape in [b for b in self._player.usable_blocks()[::-1] if b != BlockType.X]:
-            for rot in range(8):
-                #if is_valid_rotation(shape.name, rot) == 0 :
-                #    continue
-                for y in range(1, self._board.shape_y - np.size(shape.block_map, axis=0)):
-                    for x in range(1, self._board.shape_x - np.size(shape.block_map, axis=1)):
-                        try:
-                            block = Block(shape, BlockRotation(rot))
-                            piece = Board.PaddedBlock(self._board, block, Position(x, y))
-                            if self._board.can_place(self._player, piece, first=(self.my_turn == 0)):
-                                self._player.use_block(block)
-                                self._board.place_block(self._player, piece)
-
-                                print((piece))
-                                score = self.minmax(self._board, 2, float('-inf'), float('inf'), False)
-                                print("score:", score)
-                                self._player.unuse_block(block)
-                                self._board.remove_block(self._player, piece)
-
-                                if score > best_score:
-                                    best_score = score
-                                    to_s = "0123456789ABCDE"
-                                    best_action = f"{shape.name}{rot}{to_s[x]}{to_s[y]}"
-                        except ValueError as e:
-                            print(f"Invalid Position or Block: {e}")
+        moves = self._board.legal_moves(self._player, self._player.usable_blocks(),
+                                        first=(self.my_turn == 0)).tolist()
+        if moves:
+            best_move = self.search(moves)
+            # 選んだブロックを使用済みにする
+            self._board.make_move(self._player, best_move)
+            best_action = PlacementTable.action(*best_move)
 
         self.my_turn += 1
         print(best_action)
         return best_action
 
+    def search(self, moves: list[list[int]]) -> list[int]:
+        """
+        反復深化でmovesから最善手を選ぶ。前の深さで評価の高かった手から読み、
+        time_limitを過ぎたら、その深さで読み終えた手の中の最善手を使う
+        """
+        self._deadline = time.perf_counter() + self.time_limit
+        entry = self._tt.probe(self._board.zobrist_hash)
+        if entry is not None and entry.best_move in moves:
+            moves.remove(entry.best_move)
+            moves.insert(0, entry.best_move)
+
+        best_move = moves[0]
+        for depth in range(1, self.search_depth + 1):
+            scores = self.search_root(moves, depth)
+            if not scores:
+                break
+            # 読めた手を評価の高い順に並べ直し、次の深さではそこから読む（同点なら元の順）
+            order = sorted(range(len(scores)), key=lambda i: -scores[i])
+            moves = [moves[i] for i in order] + moves[len(scores):]
+            best_move = moves[0]
+            if len(scores) < len(moves):
+                break
+        return best_move
+
+    def search_root(self, moves: list[list[int]], depth: int) -> list[float]:
+        """
+        movesを先頭から深さdepthで読んだ評価値（最善手以外は上限値）
+        time_limitを過ぎたら、読みかけの手を捨ててそこまでで打ち切る
+        """
+        scores = []
+        alpha = float('-inf')
+        for move in moves:
+            self._board.make_move(self._player, move)
+            try:
+                score = self.minmax(self._board, depth - 1, alpha, float('inf'), False)
+            except SearchTimeout:
+                break
+            finally:
+                self._board.unmake_move()
+            scores.append(score)
+            alpha = max(alpha, score)
+        return scores
+
     #def is_valid_rotation(shape, rot) :
     #    if rot == 0 :
     #        return 1 :
@@ -99,73 +137,80 @@ class PlayerClient:
     #        for x in range(1, board.shape_x - np.size(shape.block_map, axis=1)):
 
     def calculate_score(self, board, player):
-        usable_blocks = player.usable_blocks()
-        placeable_positions = 0
-        for shape in usable_blocks:
-            for rot in range(8):
-                for y in range(1, board.shape_y - np.size(shape.block_map, axis=0)):
-                    for x in range(1, board.shape_x - np.size(shape.block_map, axis=1)):
-                        block = Block(shape, BlockRotation(rot))
-                        piece = Board.PaddedBlock(board, block, Position(x, y))
-                        if board.can_place(player, piece, first=(self.my_turn == 0)):
-                            placeable_positions += 1
-        placed_blocks_area = sum(np.sum(block.block_map) for block in player.used_blocks)
+        placeable_positions = len(board.legal_moves(player, player.usable_blocks(), first=(self.my_turn == 0)))
+        placed_blocks_area = sum(np.sum(block.block_map) for block in player.used_blocks())
         return placeable_positions + placed_blocks_area
 
     def minmax(self, board, depth, alpha, beta, is_maximizing_player):
+        if time.perf_counter() > self._deadline:
+            raise SearchTimeout()
         if depth == 0:
             return self.evaluate_board(board)
 
+        key = board.zobrist_hash
+        entry = self._tt.probe(key)
+        if entry is not None and entry.depth >= depth:
+            if entry.bound == Bound.exact:
+                return entry.value
+            if entry.bound == Bound.lower and entry.value >= beta:
+                return entry.value
+            if entry.bound == Bound.upper and entry.value <= alpha:
+                return entry.value
+
+        player = self._player if is_maximizing_player else self._opponent
+        moves = board.legal_moves(player, player.usable_blocks(), first=(self.my_turn == 0)).tolist()
+        # 置換表の最善手から調べる
+        if entry is not None and entry.best_move in moves:
+            moves.remove(entry.best_move)
+            moves.insert(0, entry.best_move)
+
+        alpha_orig, beta_orig = alpha, beta
+        best_move = None
         if is_maximizing_player:
             max_eval = float('-inf')
-            for shape in self._player.usable_blocks():
-                for rot in range(8):
-                    for y in range(1, board.shape_y - np.size(shape.block_map, axis=0)):
-                        for x in range(1, board.shape_x - np.size(shape.block_map, axis=1)):
-                            try:
-                                block = Block(shape, BlockRotation(rot))
-                                piece = Board.PaddedBlock(board, block, Position(x, y))
-                                if board.can_place(self._player, piece, first=(self.my_turn == 0)):
-                                    self._player.use_block(block)
-                                    board.place_block(self._player, piece)
-
-                                    eval = self.minmax(board, depth - 1, alpha, beta, False)
-
-                                    self._player.unuse_block(block)
-                                    board.remove_block(self._player, piece)
-
-                                    max_eval = max(max_eval, eval)
-                                    alpha = max(alpha, eval)
-                                    if beta <= alpha:
-                                        break
-                            except ValueError:
-                                continue
-            return max_eval
+            for move in moves:
+                board.make_move(self._player, move)
+                try:
+                    eval = self.minmax(board, depth - 1, alpha, beta, False)
+                finally:
+                    board.unmake_move()
+
+                if eval > max_eval:
+                    max_eval = eval
+                    best_move = move
+                alpha = max(alpha, eval)
+                if beta <= alpha:
+                    break
+            best_eval = max_eval
+        else:
+            min_eval = float('inf')
+            for move in moves:
+                board.make_move(self._opponent, move)
+                try:
+                    eval = self.minmax(board, depth - 1, alpha, beta, True)
+                finally:
+                    board.unmake_move()
+
+                if eval < min_eval:
+                    min_eval = eval
+                    best_move = move
+                beta = min(beta, eval)
+                if beta <= alpha:
+                    break
+            best_eval = min_eval
+
+        if best_move is None:
+            # どちらも置けない局面は評価値をそのまま使う
+            return self.evaluate_board(board)
+
+        if best_eval <= alpha_orig:
+            bound = Bound.upper
+        elif best_eval >= beta_orig:
+            bound = Bound.lower
         else:
-            min_eval = float('-inf')
-            for shape in self._opponent.usable_blocks():
-                for rot in range(8):
-                    for y in range(1, board.shape_y - np.size(shape.block_map, axis=0)):
-                        for x in range(1, board.shape_x - np.size(shape.block_map, axis=1)):
-                            try:
-                                block = Block(shape, BlockRotation(rot))
-                                piece = Board.PaddedBlock(board, block, Position(x, y))
-                                if board.can_place(self._opponent, piece, first=(self.my_turn == 0)):
-                                    self._opponent.use_block(block)
-                                    board.place_block(self._opponent, piece)
-
-                                    eval = self.minmax(board, depth - 1, alpha, beta, True)
-
-                                    self._opponent.unuse_block(block)
-                                    board.remove_block(self._opponent, piece)
-
-                                    min_eval = min(min_eval, eval)
-                                    beta = min(beta, eval)
-                                    if beta <= alpha:
-                                        break
-                            except ValueError:
-                                continue
-            return min_eval
+            bound = Bound.exact
+        self._tt.store(key, depth, best_eval, bound, best_move)
+        return best_eval
 
 
     @staticmethod
@@ -1,5 +1,7 @@
 from __future__ import annotations
 import asyncio
+import time
+from typing import Optional
 import websockets
 
 from .Board import Board
@@ -8,12 +10,32 @@ from .Position import Position
 from .Block import Block
 from .BlockType import BlockType
 from .BlockRotation import BlockRotation
+from blocks_duo.OpeningBook import OpeningBook
+from blocks_duo.PlacementTable import PlacementTable
+from .TranspositionTable import TranspositionTable, Bound
 
 import random
 import numpy as np
 
 
 class PlayerClient:
+    # サーバに要求するプロトコル拡張（Session・headlessモードが参照する）
+    features = ('persistent', 'clock', 'moves')
+    # 探索する手数（自分の手を1手目として数える）
+    search_depth = 2
+    # 1手に使う時間の上限（秒）。超えたらそれまでの最善手を返す。持ち時間が送られてくればmove_budgetでこれ以下に減らす
+    time_limit = 8.0
+    # 持ち時間を最も多く配る手（自分の何手目か）
+    peak_turn = 7
+    # 持ち時間から決めた時間がこれより短い手は、1手読みで済ませる
+    deep_search_sec = 2.0
+    # 通信等の分として残しておく時間（秒）
+    time_margin = 0.5
+    # 置換表のメモリ上限
+    tt_max_bytes = 32 * 1024 * 1024
+    # 自分の最初のこの手数は、定跡（環境変数 BLOCKSDUO_BOOK）に手があれば読まずに指す
+    book_moves = 4
+
     def __init__(self, player_number: int, socket: websockets.WebSocketClientProtocol, loop: asyncio.AbstractEventLoop):
         self._loop = loop
         self._socket = socket
@@ -23,11 +45,26 @@ class PlayerClient:
         self._board = Board()
         self._player = Player(player_number, "pl", "player", None)
         self._opponent = Player(3 - player_number, "op", "opponent", None)
+        self._tt = TranspositionTable(self.tt_max_bytes)
 
     @property
     def player_number(self) -> int:
         return self._player_number
 
+    def new_game(self, player_number: int):
+        """
+        同じ接続で次の対戦を始める（Sessionから呼ばれる）
+        置換表の評価値は自分の席から見たものなので、席が変わったときだけ捨てる
+        """
+        if player_number != self._player_number:
+            self._tt.clear()
+        self._player_number = player_number
+        self.p1turn = 0
+        self.p2turn = 0
+        self._board = Board()
+        self._player = Player(player_number, "pl", "player", None)
+        self._opponent = Player(3 - player_number, "op", "opponent", None)
+
     async def close(self):
         await self._socket.close()
 
@@ -41,6 +78,7 @@ class PlayerClient:
 
     def create_action(self, board):
         self._board = Board.from_print_string(board)
+        self._board.init_hash(self.player_number, [self._player, self._opponent])
 
         if self.player_number == 1:
             turn = self.p1turn
@@ -49,49 +87,56 @@ class PlayerClient:
             turn = self.p2turn
             self.p2turn += 1
 
+        status = Board.parse_status(board)
+        legal_moves = Board.status_moves(status)
+        if turn < self.book_moves:
+            move = self.book_move(legal_moves, turn == 0)
+            if move is not None:
+                self._board.make_move(self._player, move)
+                return PlacementTable.action(*move)
+
         # 初手の例外処理
         if turn == 0:
             return self.initial_move()
 
+        start = time.perf_counter()
+        time_limit = self.move_budget(status, turn)
+        depth = self.search_depth if time_limit >= self.deep_search_sec else 1
+        moves = self.ordered_moves(self._board, self._player, legal_moves)
+        # 1手しかなければ読まずに指す
+        if len(moves) == 1:
+            self._board.make_move(self._player, moves[0])
+            return PlacementTable.action(*moves[0])
+
         best_score = float('-inf')
         best_action = 'X000'
+        best_move = None
         n_searched = 0
-
-        for shape in [b for b in self._player.usable_blocks() if b != BlockType.X]:
-            for rot in range(8):
-                for y in range(1, self._board.shape_y - shape.block_map.shape[0] + 1):
-                    for x in range(1, self._board.shape_x - shape.block_map.shape[1] + 1):
-                        try:
-                            n_searched += 1
-                            block = Block(shape, BlockRotation(rot))
-                            piece = Board.PaddedBlock(self._board, block, Position(x, y))
-                            if self._player.can_use_block(block) and self._board.can_place(self._player, piece):
-                                #print(piece.map)
-                                self._player.use_block(block)
-                                self._board.place_block(self._player, piece)
-
-                                score = self.minmax(self._board, 0, float('-inf'), float('inf'), False)
-
-                                self._player.unuse_block(block)
-                                self._board.remove_block(self._player, piece)
-
-                                if score >= best_score:
-                                    best_score = score
-                                    to_s = "0123456789ABCDE"
-                                    best_action = f"{shape.name}{rot}{to_s[x]}{to_s[y]}"
-                                    print(n_searched, ":", best_action)
-                                    if n_searched >= 100:
-                                        self._player.use_block(block)
-                                        self._board.place_block(self._player, piece)
-                                        return best_action
-                                else:
-                                    pass
-
-                        except ValueError as e:
-                            print(f"Invalid Position or Block: {e}")
-
-        # self._player.use_block(block)
-        # self._board.place_block(self._player, piece)
+        # 1手読むのにかかった最長の時間
+        slowest = 0.0
+
+        for move in moves:
+            # 次の1手を読み終えられそうになければ、それまでの最善手を返す
+            if best_move is not None and time.perf_counter() - start + slowest > time_limit:
+                break
+            n_searched += 1
+            move_start = time.perf_counter()
+            self._board.make_move(self._player, move)
+
+            score = self.minmax(self._board, depth - 1, best_score, float('inf'), False)
+
+            self._board.unmake_move()
+            slowest = max(slowest, time.perf_counter() - move_start)
+
+            if best_move is None or score > best_score:
+                best_score = score
+                best_action = PlacementTable.action(*move)
+                best_move = move
+                print(n_searched, ":", best_action)
+
+        # 選んだブロックを使用済みにする
+        if best_move is not None:
+            self._board.make_move(self._player, best_move)
         print(n_searched, ":", best_action)
         return best_action
 
@@ -99,38 +144,20 @@ class PlayerClient:
 
     def initial_move(self):
         largest_block = max(list(self._player.usable_blocks())[::-1], key=lambda b: np.sum(Block(b, BlockRotation(0)).block_map))
-        rotations = [BlockRotation(rot) for rot in range(8)]
-        positions = []
         print(self._board.to_print_string())
 
-        if self.player_number == 1:
-            target_position = Position(5, 5)
-        else:
-            target_position = Position(10, 10)
-
-        for rot in rotations:
-            block = Block(largest_block, rot)
-            for y in range(target_position.y - block.block_map.shape[0] + 2, target_position.y + 2):
-                for x in range(target_position.x - block.block_map.shape[1] + 2, target_position.x + 2):
-                    try:
-                        piece = Board.PaddedBlock(self._board, block, Position(x, y))
-                        #print(piece.map)
-                        if self._board.can_place_first_block(self._player, piece):
-                            to_s = "0123456789ABCDE"
-                            data = f"{largest_block.name}{rot.value}{to_s[x]}{to_s[y]}"
-                            print(data)
-                            self._player.use_block(block)
-                            return data
-                    except ValueError as e:
-                        print(e)
-                        pass
+        for piece_index, rot, x, y in self._board.legal_moves(self._player, [largest_block], first=True).tolist():
+            block = PlacementTable.block_of(piece_index, rot)
+            data = PlacementTable.action(piece_index, rot, x, y)
+            print(data)
+            self._player.use_block(block)
+            return data
 
         raise ValueError("No valid initial move found")
 
     def evaluate_board(self, board: Board):
         player_score = self.calculate_score(board, self._player)
         opponent_score = self.calculate_score(board, self._opponent)
-        print("eveluate score:", player_score)
         return player_score - opponent_score
 
     def calculate_score(self, board: Board, player: Player):
@@ -152,60 +179,115 @@ class PlayerClient:
         placed_blocks_area = sum(np.sum(block.block_map) for block in player.used_blocks())
         return placeable_positions + placed_blocks_area
 
+    def move_budget(self, status: dict[str, list[str]], turn: int) -> float:
+        """
+        この手（自分のturn手目）に使う時間。clockの行（自分の残り, 相手の残り, この手の上限）があれば、
+        残りのブロック数だけ手を指すとして、move_weightの重みの割合で持ち時間を配る
+        time_limitと、この手の上限からtime_marginを引いた時間は超えない
+        """
+        clock = status.get('clock')
+        if clock is None:
+            return self.time_limit
+        own, _, move_limit = (float(value) for value in clock)
+        pieces_left = max(len(self._player.usable_blocks()) - 1, 1)
+        weights = [self.move_weight(t) for t in range(turn, turn + pieces_left)]
+        share = own * weights[0] / sum(weights)
+        return max(0.0, min(share - self.time_margin, self.time_limit, move_limit - self.time_margin))
+
+    def move_weight(self, turn: int) -> float:
+        """
+        持ち時間を配る重み。置ける手が多く読みが効く中盤（peak_turn手目）を序盤・終盤の2倍にする
+        """
+        return 1.0 + max(0.0, 1.0 - abs(turn - self.peak_turn) / self.peak_turn)
+
+    def book_move(self, legal_moves: Optional[np.ndarray], first: bool) -> Optional[list[int]]:
+        """
+        定跡にある手（定跡がない・この局面が載っていなければNone）
+        """
+        book = OpeningBook.default()
+        if book is None:
+            return None
+        if legal_moves is None:
+            legal_moves = self._board.legal_moves(self._player, self._player.usable_blocks(), first)
+        return book.best_move(self._board.position_key(self.player_number), legal_moves)
+
+    def ordered_moves(self, board: Board, player: Player, legal_moves: Optional[np.ndarray] = None) -> list[list[int]]:
+        """
+        置換表に最善手があれば先頭にした合法手のリスト
+        legal_movesはサーバが送ってきた手（moves拡張）。なければ盤面から求める
+        """
+        if legal_moves is None:
+            legal_moves = board.legal_moves(player, player.usable_blocks())
+        moves = legal_moves.tolist()
+        entry = self._tt.probe(board.zobrist_hash)
+        if entry is not None and entry.best_move in moves:
+            moves.remove(entry.best_move)
+            moves.insert(0, entry.best_move)
+        return moves
+
     def minmax(self, board, depth, alpha, beta, is_maximizing_player):
         if depth == 0:
             return self.evaluate_board(board)
 
+        key = board.zobrist_hash
+        entry = self._tt.probe(key)
+        if entry is not None and entry.depth >= depth:
+            if entry.bound == Bound.exact:
+                return entry.value
+            if entry.bound == Bound.lower and entry.value >= beta:
+                return entry.value
+            if entry.bound == Bound.upper and entry.value <= alpha:
+                return entry.value
+
+        player = self._player if is_maximizing_player else self._opponent
+        moves = board.legal_moves(player, player.usable_blocks()).tolist()
+        if not moves:
+            return self.evaluate_board(board)
+        if entry is not None and entry.best_move in moves:
+            moves.remove(entry.best_move)
+            moves.insert(0, entry.best_move)
+
+        alpha_orig, beta_orig = alpha, beta
+        best_move = None
         if is_maximizing_player:
-            max_eval = float('-inf')
-            for shape in self._player.usable_blocks():
-                for rot in range(8):
-                    for y in range(1, board.shape_y - np.size(shape.block_map, axis=0)):
-                        for x in range(1, board.shape_x - np.size(shape.block_map, axis=1)):
-                            try:
-                                block = Block(shape, BlockRotation(rot))
-                                piece = Board.PaddedBlock(board, block, Position(x, y))
-                                if board.can_place(self._player, piece):
-                                    self._player.use_block(block)
-                                    board.place_block(self._player, piece)
-
-                                    eval = self.minmax(board, depth - 1, alpha, beta, False)
-
-                                    self._player.unuse_block(block)
-                                    board.remove_block(self._player, piece)
-
-                                    max_eval = max(max_eval, eval)
-                                    alpha = max(alpha, eval)
-                                    if beta <= alpha:
-                                        break
-                            except ValueError:
-                                continue
-            return max_eval
+            best_eval = float('-inf')
+            for move in moves:
+                board.make_move(player, move)
+
+                eval = self.minmax(board, depth - 1, alpha, beta, False)
+
+                board.unmake_move()
+
+                if eval > best_eval:
+                    best_eval = eval
+                    best_move = move
+                alpha = max(alpha, eval)
+                if beta <= alpha:
+                    break
+        else:
+            best_eval = float('inf')
+            for move in moves:
+                board.make_move(player, move)
+
+                eval = self.minmax(board, depth - 1, alpha, beta, True)
+
+                board.unmake_move()
+
+                if eval < best_eval:
+                    best_eval = eval
+                    best_move = move
+                beta = min(beta, eval)
+                if beta <= alpha:
+                    break
+
+        if best_eval <= alpha_orig:
+            bound = Bound.upper
+        elif best_eval >= beta_orig:
+            bound = Bound.lower
         else:
-            min_eval = float('-inf')
-            for shape in self._opponent.usable_blocks():
-                for rot in range(8):
-                    for y in range(1, board.shape_y - np.size(shape.block_map, axis=0)):
-                        for x in range(1, board.shape_x - np.size(shape.block_map, axis=1)):
-                            try:
-                                block = Block(shape, BlockRotation(rot))
-                                piece = Board.PaddedBlock(board, block, Position(x, y))
-                                if board.can_place(self._opponent, piece):
-                                    self._opponent.use_block(block)
-                                    board.place_block(self._opponent, piece)
-
-                                    eval = self.minmax(board, depth - 1, alpha, beta, True)
-
-                                    self._opponent.unuse_block(block)
-                                    board.remove_block(self._opponent, piece)
-
-                                    min_eval = min(min_eval, eval)
-                                    beta = min(beta, eval)
-                                    if beta <= alpha:
-                                        break
-                            except ValueError:
-                                continue
-            return min_eval
+            bound = Bound.exact
+        self._tt.store(key, depth, best_eval, bound, best_move)
+        return best_eval
 
     @staticmethod
     async def create(url: str, loop: asyncio.AbstractEventLoop) -> PlayerClient:
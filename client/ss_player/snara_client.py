@@ -4,15 +4,15 @@ import websockets
 
 from .Board import Board
 from .Player import Player
-from .Position import Position
-from .Block import Block
 from .BlockType import BlockType
-from .BlockRotation import BlockRotation
+from blocks_duo.PlacementTable import PlacementTable, Pieces
 import random
-import numpy as np
 
 
 class PlayerClient:
+    # サーバに置ける手の一覧を送ってもらい、自分では合法手を求めない
+    features = ('persistent', 'moves')
+
     def __init__(self, player_number: int, socket: websockets.WebSocketClientProtocol, loop: asyncio.AbstractEventLoop):
         self._loop = loop
         self._socket = socket
@@ -42,7 +42,6 @@ class PlayerClient:
         actions: list[str]
         turn: int
 
-        self._board = Board.from_print_string(board)
         if self.player_number == 1:
             # self.p1Actions = ['U034', 'B037', 'J266', 'M149', 'O763', 'R0A3', 'F0C6', 'K113', 'T021', 'L5D2', 'G251', 'E291', 'D057', 'A053']
             # actions = self.p1Actions
@@ -56,25 +55,18 @@ class PlayerClient:
             turn = self.p2turn
             self.p2turn += 1
 
-        # for shape in [b for b in self._player.usable_blocks()[::-1] if b != BlockType.X]:
+        moves = Board.status_moves(Board.parse_status(board))
+        if moves is None:
+            self._board = Board.from_print_string(board)
+            moves = self._board.legal_moves(self._player, self._player.usable_blocks(), first=(turn == 0))
+        # ブロックの種類はランダムな順で試し、同じ種類の中では盤面の左上から探す
         for shape in random.sample([b for b in self._player.usable_blocks() if b != BlockType.X], len(self._player.usable_blocks())-1):
-            for rot in range(8):
-                for y in range(1, self._board.shape_y - np.size(shape.block_map, axis=0)):
-                    for x in range(1, self._board.shape_x - np.size(shape.block_map, axis=1)):
-                        try:
-                            block = Block(shape, BlockRotation(rot))
-                            piece = Board.PaddedBlock(self._board, block, Position(x, y))
-                            if (self._board.can_place_first_block(self._player, piece) if turn == 0
-                                    else self._board.can_place(self._player, piece)):
-                                self._player.use_block(block)
-                                self._board.place_block(self._player, piece)
-                                to_s = "0123456789ABCDE"
-                                data = f"{shape.name}{rot}{to_s[x]}{to_s[y]}"
-                                print(data)
-                                return data
-
-                        except Exception as e:
-                            print(type(e), e)
+            for piece_index, rot, x, y in moves[moves[:, 0] == Pieces.index(shape.value)].tolist():
+                # 盤面は毎回送られてくるので、使ったブロックだけ覚えておく
+                self._player.use_block(PlacementTable.block_of(piece_index, rot))
+                data = PlacementTable.action(piece_index, rot, x, y)
+                print(data)
+                return data
         else:
             # パスを選択
             print("X000")
@@ -0,0 +1,138 @@
+from __future__ import annotations
+import sqlite3
+import time
+from typing import Optional
+
+from blocks_duo.BattleRecord import BattleRecord
+from blocks_duo.PlacementTable import PlacementTable
+
+# まとめて1回のトランザクションで書き込む手の数
+BATCH_MOVES = 20000
+
+_Schema = '''
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    player1 TEXT NOT NULL,
+    player2 TEXT NOT NULL,
+    source TEXT,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    match_id INTEGER REFERENCES matches(id),
+    round INTEGER,
+    player1 TEXT NOT NULL,
+    player2 TEXT NOT NULL,
+    winner INTEGER NOT NULL,
+    reason INTEGER NOT NULL,
+    points1 INTEGER NOT NULL,
+    points2 INTEGER NOT NULL,
+    source TEXT
+);
+CREATE TABLE IF NOT EXISTS moves (
+    game_id INTEGER NOT NULL REFERENCES games(id),
+    ply INTEGER NOT NULL,
+    seat INTEGER NOT NULL,
+    player TEXT NOT NULL,
+    piece TEXT NOT NULL,
+    rotation INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    position_key INTEGER NOT NULL,
+    PRIMARY KEY (game_id, ply)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS moves_position ON moves (position_key);
+CREATE INDEX IF NOT EXISTS moves_player_piece ON moves (player, piece, ply);
+CREATE INDEX IF NOT EXISTS games_match ON games (match_id);
+CREATE INDEX IF NOT EXISTS games_player1 ON games (player1);
+CREATE INDEX IF NOT EXISTS games_player2 ON games (player2);
+'''
+
+
+def _signed(key: int) -> int:
+    # SQLiteのINTEGERは符号付き64bitなので、Zobristキーを同じビット列の符号付きの値にする
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+
+class Archive:
+    """
+    対戦・ゲーム・手・局面のキーを保存するSQLiteのデータベース
+    書き込みは1プロセス（トーナメントやリプレイの親プロセス）だけで行う前提で、idは自分で振る
+    追加した行は溜めておき、BATCH_MOVES手ごと（とclose時）に1回のトランザクションで書き込む
+    """
+
+    def __init__(self, path: str, batch_moves: int = BATCH_MOVES):
+        self.__connection = sqlite3.connect(path)
+        self.__connection.executescript(_Schema)
+        self.__batch_moves = batch_moves
+        self.__matches: list[tuple] = []
+        self.__games: list[tuple] = []
+        self.__moves: list[tuple] = []
+        self.__next_match_id = self.__next_id('matches')
+        self.__next_game_id = self.__next_id('games')
+
+    def __next_id(self, table: str) -> int:
+        return self.__connection.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}').fetchone()[0]
+
+    def add_match(self, player1: str, player2: str, source: Optional[str] = None) -> int:
+        match_id = self.__next_match_id
+        self.__next_match_id += 1
+        self.__matches.append((match_id, player1, player2, source, time.time()))
+        return match_id
+
+    def add_game(self, record: BattleRecord, replayed: dict, match_id: Optional[int] = None,
+                 round_: Optional[int] = None, source: Optional[str] = None) -> int:
+        """
+        1ゲーム分の棋譜を追加する
+        replayedはReplay.validate(record)の戻り値（得点と、各手の前の局面のキー）
+        """
+        game_id = self.__next_game_id
+        self.__next_game_id += 1
+        points1, points2 = replayed['points']
+        self.__games.append((game_id, match_id, round_, record.player1_name, record.player2_name,
+                             record.winner, int(record.reason), points1, points2, source))
+
+        names = {'1': record.player1_name, '2': record.player2_name}
+        for ply, ((seat, action), key) in enumerate(zip(record.records, replayed['keys']), 1):
+            if BattleRecord.encode_move(int(seat), action) is None:
+                # 形式が壊れた手（反則負けになった手）は保存しない
+                break
+            rotation, x, y = int(action[1]), int(action[2], 16), int(action[3], 16)
+            placement = PlacementTable.placements.get((action[0], rotation, x - 1, y - 1))
+            if placement is not None:
+                # 対称で同じ形になる向きは、legal_movesが返す向きにまとめる（定跡で同じ手として数えるため）
+                rotation = placement.block.block_rotation.value
+            self.__moves.append((game_id, ply, int(seat), names[seat], action[0], rotation, x, y, _signed(key)))
+
+        if len(self.__moves) >= self.__batch_moves:
+            self.flush()
+        return game_id
+
+    def flush(self):
+        with self.__connection:
+            self.__connection.executemany('INSERT INTO matches VALUES (?, ?, ?, ?, ?)', self.__matches)
+            self.__connection.executemany('INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', self.__games)
+            self.__connection.executemany('INSERT INTO moves VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', self.__moves)
+        self.__matches.clear()
+        self.__games.clear()
+        self.__moves.clear()
+
+    def close(self):
+        self.flush()
+        self.__connection.close()
+
+    def games_opened_with(self, player: str, piece: str) -> list[int]:
+        """
+        playerが初手にpieceを置いたゲームのid
+        """
+        return [row[0] for row in self.__connection.execute(
+            'SELECT game_id FROM moves WHERE player = ? AND piece = ? AND ply <= 2 ORDER BY game_id',
+            (player, piece))]
+
+    def occurrences(self, position_key: int) -> list[tuple[int, int]]:
+        """
+        局面のキー（Board.position_key）が現れた (ゲームのid, 何手目) の一覧
+        """
+        return self.__connection.execute(
+            'SELECT game_id, ply FROM moves WHERE position_key = ? ORDER BY game_id, ply',
+            (_signed(position_key),)).fetchall()
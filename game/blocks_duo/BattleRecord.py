@@ -1,45 +1,145 @@
 from __future__ import annotations
 
-import csv
-from typing import Optional
+import struct
+from typing import BinaryIO, Optional
 
+from blocks_duo.BlockType import BlockType
+from blocks_duo.FinishedReason import FinishedReason
 from blocks_duo.Player import Player
 
+# 棋譜ファイル（追記のみのバイナリ形式）
+#   ヘッダ: MAGIC, VERSION, 席ごとに (席番号 1byte, 名前の長さ 2byte, 名前 UTF-8)
+#   以降は1手4byteの固定長: ((席番号 << 5) | ブロックの番号, 回転, x, y)
+#   最後に結果: (RESULT_MARK, 勝った席番号（引き分けは0）, FinishedReason, 0)
+MAGIC = b'BDRP'
+VERSION = 1
+RESULT_MARK = 0xFF
+RECORD_SIZE = 4
+
+_Header = struct.Struct('<4sB')
+_Seat = struct.Struct('<BH')
+_Record = struct.Struct('<4B')
+# BlockTypeの並び順での番号（PlacementTable.Piecesと同じ）
+_PieceIndex = {b.value: i for i, b in enumerate(BlockType)}
+_PieceValues = [b.value for b in BlockType]
+
 
 class BattleRecord:
 
-    player1_name: str
-    player2_name: str
-    records: [(str, str)] = []
-    result: str = ''
+    def __init__(self, player1_name: str, player2_name: str):
+        self.player1_name = player1_name
+        self.player2_name = player2_name
+        self.records: list[tuple[str, str]] = []
+        self.result = ''
+        # 勝った席番号（引き分けは0）
+        self.winner = 0
+        self.reason = FinishedReason.normal
+        self.__fp: Optional[BinaryIO] = None
+
+    def open(self, target: str):
+        """
+        targetに棋譜を書き始める。以降の手と結果は記録するたびに追記する
+        """
+        self.close()
+        self.__fp = open(target, mode='wb')
+        self.__fp.write(self.__header())
+        for seat, turn in self.records:
+            self.__write_move(int(seat), turn)
 
-    def __init__(self, player1: Player, player2: Player):
-        self.player1_name = player1.player_name
-        self.player2_name = player2.player_name
+    def close(self):
+        if self.__fp is not None:
+            self.__fp.close()
+            self.__fp = None
 
     def add_record(self, player: Player, turn: str):
         self.records.append((f'{player.player_number}', turn))
+        self.__write_move(player.player_number, turn)
 
-    def add_result(self, winner: Optional[Player]):
+    def add_result(self, winner: Optional[Player], reason: FinishedReason = FinishedReason.normal):
         if winner is None:
             self.result = 'draw'
+            self.winner = 0
         else:
             self.result = f'winner is {winner.player_name}'
+            self.winner = winner.player_number
+        self.reason = reason
+        if self.__fp is not None:
+            self.__fp.write(_Record.pack(RESULT_MARK, self.winner, self.reason, 0))
+            self.__fp.flush()
 
     def clear(self):
         self.records.clear()
         self.result = ''
+        self.winner = 0
+        self.reason = FinishedReason.normal
 
     def output(self, target):
-        with open(target, mode='w') as fp:
-            writer = csv.writer(fp)
+        """
+        ここまでの棋譜をまとめてtargetに書き出す
+        """
+        self.open(target)
+        if self.result:
+            self.__fp.write(_Record.pack(RESULT_MARK, self.winner, self.reason, 0))
+        self.close()
+
+    def __header(self) -> bytes:
+        ret = [_Header.pack(MAGIC, VERSION)]
+        for seat, name in ((1, self.player1_name), (2, self.player2_name)):
+            encoded = name.encode('utf-8')
+            ret.append(_Seat.pack(seat, len(encoded)))
+            ret.append(encoded)
+        return b''.join(ret)
 
-            writer.writerow(f'player 1: {self.player1_name}')
-            writer.writerow(f'player 2: {self.player2_name}')
-            record_str_list = [f'{record[0]}: {record[1]}' for record in self.records]
-            writer.writerows(record_str_list)
-            writer.writerow(self.result)
+    def __write_move(self, seat: int, turn: str):
+        if self.__fp is None:
+            return
+        record = BattleRecord.encode_move(seat, turn)
+        # 形式が壊れた手は記録できない（反則負けの結果だけが残る）
+        if record is not None:
+            self.__fp.write(record)
+
+    @staticmethod
+    def encode_move(seat: int, turn: str) -> Optional[bytes]:
+        """
+        手の文字列（例: U034）を4byteの記録にする。解釈できなければNone
+        """
+        try:
+            return _Record.pack((seat << 5) | _PieceIndex[turn[0]], int(turn[1]), int(turn[2], 16), int(turn[3], 16))
+        except (KeyError, IndexError, ValueError, struct.error):
+            return None
+
+    @staticmethod
+    def decode_move(record: tuple[int, int, int, int]) -> tuple[str, str]:
+        """
+        4byteの記録を (席番号, 手の文字列) にする
+        """
+        b0, rotation, x, y = record
+        return f'{b0 >> 5}', f'{_PieceValues[b0 & 0x1F]}{rotation}{x:X}{y:X}'
 
     @staticmethod
     def read_record(target: str) -> BattleRecord:
-        pass
+        with open(target, mode='rb') as fp:
+            data = fp.read()
+
+        magic, version = _Header.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{target}: not a battle record')
+        offset = _Header.size
+        names = {}
+        for _ in range(2):
+            seat, length = _Seat.unpack_from(data, offset)
+            offset += _Seat.size
+            names[seat] = data[offset:offset + length].decode('utf-8')
+            offset += length
+
+        ret = BattleRecord(names[1], names[2])
+        # 書き込み途中で止まった棋譜は、最後の不完全な記録を無視する
+        end = offset + (len(data) - offset) // RECORD_SIZE * RECORD_SIZE
+        for record in _Record.iter_unpack(data[offset:end]):
+            if record[0] == RESULT_MARK:
+                ret.winner = record[1]
+                ret.reason = FinishedReason(record[2])
+                ret.result = 'draw' if ret.winner == 0 else f'winner is {names[ret.winner]}'
+                break
+            ret.records.append(BattleRecord.decode_move(record))
+        return ret
@@ -0,0 +1,90 @@
+from __future__ import annotations
+import numpy as np
+
+BOARD_SIZE = 14
+# 各行の右端に番兵列を1つ置く（左右シフトで隣の行へ回り込まないようにするため）
+STRIDE = BOARD_SIZE + 1
+BOARD_BITS = BOARD_SIZE * STRIDE
+BOARD_MASK = sum(((1 << BOARD_SIZE) - 1) << (y * STRIDE) for y in range(BOARD_SIZE))
+_BOARD_BYTES = (BOARD_BITS + 7) // 8
+# numpyでまとめて判定するときのuint64のワード数
+WORDS = (BOARD_BITS + 63) // 64
+_WORD_MASK = (1 << 64) - 1
+
+
+class BitBoard:
+    """
+    14x14の盤面を1つのintで表すビット演算ヘルパー
+    セル(x, y)はビット y * STRIDE + x に対応する
+    """
+
+    @staticmethod
+    def bit(x: int, y: int) -> int:
+        return 1 << (y * STRIDE + x)
+
+    @staticmethod
+    def from_map(map_) -> int:
+        """
+        14x14の配列の非ゼロセルをビット列に変換する
+        """
+        padded = np.zeros((BOARD_SIZE, STRIDE), dtype=np.uint8)
+        padded[:, :BOARD_SIZE] = np.asarray(map_) != 0
+        return int.from_bytes(np.packbits(padded, bitorder='little').tobytes(), 'little')
+
+    @staticmethod
+    def to_map(bits: int) -> np.ndarray:
+        """
+        ビット列を0/1の14x14配列に変換する
+        """
+        raw = np.frombuffer(bits.to_bytes(_BOARD_BYTES, 'little'), dtype=np.uint8)
+        cells = np.unpackbits(raw, bitorder='little')[:BOARD_BITS]
+        return cells.reshape(BOARD_SIZE, STRIDE)[:, :BOARD_SIZE].astype(np.int64)
+
+    @staticmethod
+    def to_words(bits: int) -> np.ndarray:
+        """
+        ビット列をuint64のワード配列に変換する（PlacementTableの*_wordsと比較する用）
+        """
+        return np.array([(bits >> (64 * i)) & _WORD_MASK for i in range(WORDS)], dtype=np.uint64)
+
+    @staticmethod
+    def to_words_array(bits_list: list[int]) -> np.ndarray:
+        """
+        複数のビット列を (len(bits_list), WORDS) のuint64配列に変換する
+        """
+        words = np.empty((len(bits_list), WORDS), dtype=np.uint64)
+        for i in range(WORDS):
+            words[:, i] = [(bits >> (64 * i)) & _WORD_MASK for bits in bits_list]
+        return words
+
+    @staticmethod
+    def edge_neighbours(bits: int) -> int:
+        """
+        上下左右に隣接するセル（自身を含む場合がある）
+        """
+        return ((bits << 1) | (bits >> 1) | (bits << STRIDE) | (bits >> STRIDE)) & BOARD_MASK
+
+    @staticmethod
+    def corner_neighbours(bits: int) -> int:
+        """
+        斜めに隣接するセル（自身を含む場合がある）
+        """
+        return ((bits << (STRIDE - 1)) | (bits >> (STRIDE - 1))
+                | (bits << (STRIDE + 1)) | (bits >> (STRIDE + 1))) & BOARD_MASK
+
+    @staticmethod
+    def cells(bits: int) -> list[int]:
+        """
+        立っているビットのセル位置（now_board()上のflat index）
+        """
+        ret = []
+        while bits:
+            low = bits & -bits
+            index = low.bit_length() - 1
+            ret.append(index // STRIDE * BOARD_SIZE + index % STRIDE)
+            bits ^= low
+        return ret
+
+    @staticmethod
+    def count(bits: int) -> int:
+        return bin(bits).count('1')
@@ -1,19 +1,44 @@
 from __future__ import annotations
 import numpy as np
 
+from blocks_duo.BitBoard import BitBoard
 from blocks_duo.Block import Block
+from blocks_duo.PlacementTable import Placement, PlacementTable
 from blocks_duo.Player import Player
 from blocks_duo.Position import Position
+from blocks_duo.Zobrist import Zobrist
 
 EmptyChar = '.'
 Player1Char = 'o'
 Player2Char = 'x'
 
+RowIds = '123456789ABCDE'
+# セルの値 -> 文字 / 文字コード -> セルの値 の変換表
+_CellChars = np.frombuffer(f'{EmptyChar}{Player1Char}{Player2Char}'.encode('ascii'), dtype=np.uint8)
+_CellValues = np.zeros(256, dtype=np.int64)
+_CellValues[ord(Player1Char)] = 1
+_CellValues[ord(Player2Char)] = 2
+
+# 初手で必ず覆う必要があるセル
+StartBits = {1: BitBoard.bit(4, 4), 2: BitBoard.bit(9, 9)}
+
 
 class Board:
     def __init__(self):
         self.__board = np.zeros((14, 14), dtype=np.int64)
-        pass
+        # __boardを書き換えるたびに進める（to_print_stringのキャッシュ用）
+        self.__version = 0
+        self.__printed: tuple[int, str] = (-1, '')
+        # プレイヤー番号ごとの占有セル（ビットボード）、0番は未使用
+        self.__occupancy = [0, 0, 0]
+        # プレイヤー番号ごとの置いたセル数
+        self.__points = [0, 0, 0]
+        # 置くと反則になるセル（埋まっている or 自分のブロックと辺で接する）
+        self.__forbidden = [0, 0, 0]
+        # 次に置くブロックが覆うべきセル（自分のブロックと角で接する空きセル）
+        self.__anchors = [0, 0, 0]
+        # 置いたセルのZobristキーのXOR（Zobrist.board_key(now_board())と同じ値）
+        self.__hash = 0
 
     def now_board(self):
         """
@@ -22,6 +47,27 @@ class Board:
         """
         return self.__board
 
+    def anchors(self, player: Player) -> int:
+        return self.__anchors[player.player_number]
+
+    def forbidden(self, player: Player) -> int:
+        return self.__forbidden[player.player_number]
+
+    @property
+    def zobrist_hash(self) -> int:
+        return self.__hash
+
+    def position_key(self, side_to_move: int) -> int:
+        """
+        side_to_moveの手番としての局面のキー（Zobrist.position_key）
+        :return:
+        """
+        return Zobrist.position_key(self.__hash, side_to_move)
+
+    @property
+    def version(self) -> int:
+        return self.__version
+
     @property
     def shape_x(self) -> int:
         return self.__board.shape[1]
@@ -32,9 +78,9 @@ class Board:
     
     def get_point(self, player: Player) -> int:
         score = 0
-        if len(player.usable_blocks()) == 0:
+        if player.all_used:
             score += 20
-        score += len(self.__board[self.__board == player.player_number])
+        score += self.__points[player.player_number]
         return score
 
     def try_place_first_block(self, player: Player, block: Block, position: Position):
@@ -58,123 +104,116 @@ class Board:
             raise ValueError("invalid position")
 
     def can_place(self, player: Player, padded_block: PaddedBlock) -> bool:
-        if self.detect_collision(padded_block):
+        if padded_block.bits & self.__forbidden[player.player_number]:
             return False
-        if self.detect_side_connection(player, padded_block):
-            return False
-        return self.detect_corner_connection(player, padded_block)
+        return (padded_block.bits & self.__anchors[player.player_number]) != 0
 
     def can_place_first_block(self, player: Player, padded_block: PaddedBlock) -> bool:
-        if player.player_number == 1 and padded_block.block_map[4, 4] == 1:
-            return True
-        if player.player_number == 2 and padded_block.block_map[9, 9] == 1:
-            return True
-        return False
+        return (padded_block.bits & StartBits[player.player_number]) != 0
 
-    def detect_collision(self, padded_block: PaddedBlock) -> bool:
-        collision_map = padded_block.block_map
-        return self.__board.flatten().dot(collision_map.flatten()) > 0
-
-    def detect_side_connection(self, player: Player, padded_block: PaddedBlock) -> bool:
-        edge_map = padded_block.edge_map
-        player_block_map = np.zeros(self.__board.shape, dtype=np.int64)
-        player_block_map[self.__board == player.player_number] = 1
-        return player_block_map.flatten().dot(edge_map.flatten()) > 0
-
-    def detect_corner_connection(self, player: Player, padded_block: PaddedBlock) -> bool:
-        corner_map = padded_block.corner_map
-        player_block_map = np.zeros(self.__board.shape, dtype=np.int64)
-        player_block_map[self.__board == player.player_number] = 1
-        return player_block_map.flatten().dot(corner_map.flatten()) > 0
+    def legal_moves(self, player: Player, usable_blocks, first=False) -> np.ndarray:
+        """
+        置ける手を全て (piece, rotation, x, y) の行の配列で返す
+        pieceはPlacementTable.Piecesでのインデックス、x, yはPositionに渡す1始まりの座標
+        :return: shape (手の数, 4) のint8配列
+        """
+        table = PlacementTable
+        if first:
+            # 初手は開始位置を覆うかだけを見る
+            rows = table.covering_rows(BitBoard.cells(StartBits[player.player_number]))
+            return table.moves[rows[table.piece_mask(usable_blocks)[table.moves[rows, 0]]]]
+
+        anchors = self.__anchors[player.player_number]
+        if not anchors:
+            return table.moves[:0]
+        rows = table.covering_rows(BitBoard.cells(anchors))
+        rows = rows[table.piece_mask(usable_blocks)[table.moves[rows, 0]]]
+        forbidden = BitBoard.to_words(self.__forbidden[player.player_number])
+        return table.moves[rows[~(table.block_words[rows] & forbidden).any(axis=1)]]
+
+    def has_legal_move(self, player: Player) -> bool:
+        """
+        初手以降で、playerが置ける手が1つでもあるか（見つかった時点で打ち切る）
+        :return:
+        """
+        table = PlacementTable
+        anchors = self.__anchors[player.player_number]
+        if not anchors:
+            return False
+        usable = table.piece_mask(player.usable_blocks())
+        forbidden = BitBoard.to_words(self.__forbidden[player.player_number])
+        for cell in BitBoard.cells(anchors):
+            rows = table.covering[cell]
+            rows = rows[usable[table.moves[rows, 0]]]
+            if rows.size and not (table.block_words[rows] & forbidden).any(axis=1).all():
+                return True
+        return False
 
     def place_block(self, player: Player, padded_block: PaddedBlock):
-        self.__board += padded_block.block_map * player.player_number
+        n = player.player_number
+        bits = padded_block.bits
+        self.__occupancy[n] |= bits
+        np.put(self.__board, padded_block.cells, n)
+        self.__version += 1
+        self.__points[n] += len(padded_block.cells)
+        self.__hash ^= Zobrist.placement_key(n, padded_block.placement.row)
+
+        self.__forbidden[n] |= bits | BitBoard.edge_neighbours(bits)
+        self.__anchors[n] = (self.__anchors[n] | BitBoard.corner_neighbours(bits)) & ~self.__forbidden[n]
+        self.__forbidden[3 - n] |= bits
+        self.__anchors[3 - n] &= ~bits
 
     def to_print_string(self) -> str:
-        row_ids = ['1', '2', '3', '4', '5', '6', '7', '8', '9', 'A', 'B', 'C', 'D', 'E']
-
-        ret: list[str] = [f' {"".join(row_ids)}']
-        for row_id, row in zip(row_ids, self.__board):
-            row_str = ''.join([
-                Player1Char if b == 1 else
-                Player2Char if b == 2 else
-                EmptyChar
-                for b in row])
-            ret.append(f'{row_id}{"".join(row_str)}')
-        return '\n'.join(ret)
+        """
+        websocketで送る盤面の文字列（同じversionの間は前回の文字列を使い回す）
+        """
+        version, printed = self.__printed
+        if version != self.__version:
+            rows = np.empty((14, 16), dtype=np.uint8)
+            rows[:, 0] = np.frombuffer(RowIds.encode('ascii'), dtype=np.uint8)
+            rows[:, 1:15] = _CellChars.take(self.__board)
+            rows[:, 15] = ord('\n')
+            printed = f' {RowIds}\n' + rows.tobytes()[:-1].decode('ascii')
+            self.__printed = (self.__version, printed)
+        return printed
 
     class PaddedBlock:
 
         def __init__(self, board: Board, block: Block, position: Position):
-            pad_top = position.y
-            pad_bottom = board.shape_y - (position.y + block.shape_y)
-            pad_left = position.x
-            pad_right = board.shape_x - (position.x + block.shape_x)
-            self.__map = np.pad(block.block_map, ((pad_top, pad_bottom), (pad_left, pad_right)))
-            self.__decorate_corner(self.__map)
-            self.__decorate_edge(self.__map)
-
-        @staticmethod
-        def __decorate_corner(map_):
-            corner_lt = np.array([[0, 0], [0, 1]])
-            corner_rt = np.array([[0, 0], [1, 0]])
-            corner_lb = np.array([[0, 1], [0, 0]])
-            corner_rb = np.array([[1, 0], [0, 0]])
-
-            corner_windows = np.lib.stride_tricks.sliding_window_view(map_, [2, 2], writeable=True)
-            for corner_windows_row in corner_windows:
-                for corner_window in corner_windows_row:
-                    if np.all(corner_window == corner_lt):
-                        corner_window[0, 0] = 2
-                    elif np.all(corner_window == corner_rt):
-                        corner_window[0, 1] = 2
-                    elif np.all(corner_window == corner_lb):
-                        corner_window[1, 0] = 2
-                    elif np.all(corner_window == corner_rb):
-                        corner_window[1, 1] = 2
-
-        @staticmethod
-        def __decorate_edge(map_):
-            edge_left = np.array([[0, 1]])
-            edge_right = np.array([[1, 0]])
-
-            vertical_windows = np.lib.stride_tricks.sliding_window_view(map_, [1, 2], writeable=True)
-            for vertical_windows_row in vertical_windows:
-                for vertical_window in vertical_windows_row:
-                    if np.all(vertical_window == edge_left):
-                        vertical_window[0, 0] = 3
-                    elif np.all(vertical_window == edge_right):
-                        vertical_window[0, 1] = 3
-
-            edge_top = np.array([[0], [1]])
-            edge_bottom = np.array([[1], [0]])
-
-            vertical_windows = np.lib.stride_tricks.sliding_window_view(map_, [2, 1], writeable=True)
-            for vertical_windows_row in vertical_windows:
-                for vertical_window in vertical_windows_row:
-                    if np.all(vertical_window == edge_top):
-                        vertical_window[0, 0] = 3
-                    elif np.all(vertical_window == edge_bottom):
-                        vertical_window[1, 0] = 3
+            self.__placement = PlacementTable.lookup(block, position)
+
+        @property
+        def placement(self) -> Placement:
+            return self.__placement
 
         @property
         def map(self):
-            return self.__map
+            return self.block_map + self.corner_map * 2 + self.edge_map * 3
+
+        @property
+        def bits(self) -> int:
+            return self.__placement.bits
+
+        @property
+        def edge_bits(self) -> int:
+            return self.__placement.edge_bits
+
+        @property
+        def corner_bits(self) -> int:
+            return self.__placement.corner_bits
+
+        @property
+        def cells(self) -> tuple[int, ...]:
+            return self.__placement.cells
 
         @property
         def block_map(self):
-            map_ = np.zeros(self.__map.shape, dtype=np.int64)
-            map_[self.__map == 1] = 1
-            return map_
+            return BitBoard.to_map(self.__placement.bits)
 
         @property
         def edge_map(self):
-            map_ = np.zeros(self.__map.shape, dtype=np.int64)
-            map_[self.__map == 3] = 1
-            return map_
+            return BitBoard.to_map(self.__placement.edge_bits)
 
         @property
         def corner_map(self):
-            map_ = np.zeros(self.__map.shape, dtype=np.int64)
-            map_[self.__map == 2] = 1
-            return map_
+            return BitBoard.to_map(self.__placement.corner_bits)
@@ -0,0 +1,32 @@
+from blocks_duo.TimeControl import TimeControl
+
+
+class Clock:
+    """
+    1対戦でのプレイヤーの残り時間
+    """
+
+    def __init__(self, time_control: TimeControl):
+        self.__time_control = time_control
+        self.__remaining = time_control.budget
+
+    @property
+    def remaining(self) -> float:
+        return self.__remaining
+
+    def move_limit(self) -> float:
+        """
+        次の1手に使える時間
+        """
+        return min(self.__remaining, self.__time_control.move_limit)
+
+    def consume(self, elapsed: float) -> bool:
+        """
+        使った時間を引き、加算分を足す
+        :return: 時間内に指せたか
+        """
+        in_time = elapsed <= self.move_limit()
+        self.__remaining = max(0.0, self.__remaining - elapsed)
+        if in_time:
+            self.__remaining += self.__time_control.increment
+        return in_time
@@ -1,7 +1,10 @@
 from __future__ import annotations
 import asyncio
+import math
 import os
+import re
 import sys
+import time
 from enum import IntEnum
 from typing import Tuple, Optional
 
@@ -9,15 +12,23 @@ from blocks_duo.BattleRecord import BattleRecord
 from blocks_duo.Block import Block
 from blocks_duo.BlockType import BlockType
 from blocks_duo.Board import Board
+from blocks_duo.Clock import Clock
 from blocks_duo.FinishedReason import FinishedReason
 from blocks_duo.GameFinishedException import GameFinishedException
-from blocks_duo.Player import Player
+from blocks_duo.LoopWatchdog import LoopWatchdog, WATCHDOG_ENV
+from blocks_duo.PhaseTimer import PhaseTimer
+from blocks_duo.PlacementTable import PlacementTable
+from blocks_duo.Player import Player, PersistentFeature, ClockFeature, MovesFeature
 from blocks_duo.PlayerFactory import PlayerFactory
 from blocks_duo.Position import Position
+from blocks_duo.TimeControl import TimeControl
 from blocks_duo.View import View
 from blocks_duo.WebsocketServer import WebsocketServer
 
-TIMEOUT_SEC = 10
+# websocketを使わず、同じプロセス内でクライアントを動かすモード
+HEADLESS_MODE = 'headless'
+# どのプレイヤーの手にも属さない処理（対戦開始時の表示など）を集計する名前
+SERVER_TIMING = '(server)'
 
 
 class Turn(IntEnum):
@@ -26,21 +37,46 @@ class Turn(IntEnum):
 
 
 class Master:
-    def __init__(self, server: WebsocketServer, p1: Player, p2: Player, loop: asyncio.AbstractEventLoop, mode: str):
+    def __init__(self, server: Optional[WebsocketServer], p1: Player, p2: Player, loop: asyncio.AbstractEventLoop,
+                 mode: str, time_control: Optional[TimeControl] = None, match_id: Optional[int] = None):
         self.__server = server
+        # トーナメントでの試合番号（同じ組み合わせの試合のファイル名を分けるのに使う）
+        self.__match_id = match_id
         self.__loop = loop
         self.__p1 = p1
         self.__p2 = p2
         self.__turn = Turn.Player1
         self.__board = Board()
         self.__mode = mode
-        self.__records = BattleRecord(p1, p2)
+        self.__records = BattleRecord(p1.player_name, p2.player_name)
+        # この対戦で終わったゲームの棋譜（ラウンド順）
+        self.__games: list[BattleRecord] = []
         self.__score = {p1.player_name: 0, p2.player_name: 0}
+        self.__time_control = time_control or TimeControl()
+        # プレイヤー番号ごとの残り時間（対戦ごとに作り直す）
+        self.__clocks = {1: Clock(self.__time_control), 2: Clock(self.__time_control)}
+        # headlessモードでは盤面や手の経過を表示しない
+        self.__quiet = mode == HEADLESS_MODE
+        # 直前に打たれた手（viewerへ送る）
+        self.__last_move: Optional[tuple[int, str]] = None
+        # ターンの処理ごとの時間。表示などは直前に手を指したプレイヤーの分として数える
+        self.__timing = PhaseTimer()
+        self.__mover = SERVER_TIMING
+        # 環境変数で指定したときだけ、イベントループを止めた処理を記録する
+        # （headlessモードはクライアントの思考でループが止まるのが当然なので使わない）
+        self.__watchdog: Optional[LoopWatchdog] = None
+        watchdog_ms = os.environ.get(WATCHDOG_ENV)
+        if watchdog_ms and mode != HEADLESS_MODE:
+            self.__watchdog = LoopWatchdog(loop, float(watchdog_ms) / 1000)
         if mode == 'view':
             self.__view = View('http://localhost:8000/api')
         else:
             self.__view = View('')
 
+    @property
+    def games(self) -> list[BattleRecord]:
+        return self.__games
+
     @property
     def player1(self) -> Player:
         return self.__p1
@@ -57,47 +93,94 @@ class Master:
     def mode(self) -> str:
         return self.__mode
 
+    @property
+    def time_control(self) -> TimeControl:
+        return self.__time_control
+
     @staticmethod
-    async def create_game(server: WebsocketServer, p1_target: str, p2_target: str,
-                          loop: asyncio.AbstractEventLoop, mode: str) -> Master:
+    async def create_game(server: Optional[WebsocketServer], p1_target: str, p2_target: str,
+                          loop: asyncio.AbstractEventLoop, mode: str,
+                          time_control: Optional[TimeControl] = None, match_id: Optional[int] = None) -> Master:
         p1_name = p1_target
         p2_name = p2_target
         if p1_target == p2_target:
             p1_name += "_1"
             p2_name += "_2"
 
-        p1 = await PlayerFactory.create(server, 1, p1_target, p1_name, loop)
-        p2 = await PlayerFactory.create(server, 2, p2_target, p2_name, loop)
-        return Master(server, p1, p2, loop, mode)
+        p1 = await Master.create_player(server, 1, p1_target, p1_name, loop, mode)
+        p2 = await Master.create_player(server, 2, p2_target, p2_name, loop, mode)
+        return Master(server, p1, p2, loop, mode, time_control, match_id)
+
+    @staticmethod
+    async def create_player(server: Optional[WebsocketServer], player_number: int, target: str, name: str,
+                            loop: asyncio.AbstractEventLoop, mode: str) -> Player:
+        if mode == HEADLESS_MODE:
+            return await PlayerFactory.create_local(player_number, target, name)
+        return await PlayerFactory.create(server, player_number, target, name, loop)
 
     async def switch_players(self):
         p1, p2 = (self.player2, self.player1)
-        self.__p1 = await PlayerFactory.create(self.__server, 1, p1.target, p1.player_name, self.__loop)
-        self.__p2 = await PlayerFactory.create(self.__server, 2, p2.target, p2.player_name, self.__loop)
+        self.__p1 = await self.next_player(1, p1)
+        self.__p2 = await self.next_player(2, p2)
         self.__board = Board()
-        self.__records.clear()
         self.__turn = Turn.Player1
 
-    async def start_match(self):
+    async def next_player(self, player_number: int, player: Player) -> Player:
+        """
+        次の対戦でplayer_numberの席に着くPlayer（persistentなクライアントは接続を使い回す）
+        """
+        if player.reusable:
+            return await PlayerFactory.reseat(player, player_number, player.player_name)
+        if PersistentFeature in player.features:
+            # 使い回さない接続は閉じてクライアントを終了させる
+            await player.close()
+        return await Master.create_player(self.__server, player_number, player.target, player.player_name,
+                                          self.__loop, self.mode)
+
+    async def start_match(self) -> dict[str, int]:
+        if self.__watchdog is not None:
+            self.__watchdog.start()
         round_ = 1
         while round_ < 6:
             print(f'start round {round_}')
             winner_name = await self.start_game(round_)
 
-            self.__score[winner_name] += 1
-            if self.__score[winner_name] > 2:
-                break
+            # 引き分けはどちらの勝ちにも数えない
+            if winner_name is not None:
+                self.__score[winner_name] += 1
+                if self.__score[winner_name] > 2:
+                    break
             await self.switch_players()
-            await asyncio.sleep(5)
+            if self.mode != HEADLESS_MODE:
+                await asyncio.sleep(5)
             round_ += 1
         await self.print_score()
+        # viewerへの送信が残っていれば送り終えるのを待つ（待つ間もループを止めないよう別スレッドで）
+        await self.__loop.run_in_executor(None, self.__view.close)
+        extra = {}
+        if self.__watchdog is not None:
+            self.__watchdog.stop()
+            extra['loop'] = self.__watchdog.summary()
+            print(f'event loop stalls: {extra["loop"]["stall_count"]}')
+        self.__timing.output(self.timing_file_name(), score=self.__score, games=len(self.__games),
+                             time_control=str(self.__time_control), **extra)
+        if self.__server is not None:
+            PlayerFactory.release(self.__server, [self.player1, self.player2])
+        return dict(self.__score)
 
     async def start_game(self, round_: int) -> Optional[str]:
         winner: Optional[Player] = None
         finished_reason = FinishedReason.normal
+        self.__clocks = {1: Clock(self.__time_control), 2: Clock(self.__time_control)}
+        self.__mover = SERVER_TIMING
+        # 棋譜は対戦ごとに作り、手が指されるたびにファイルへ追記する
+        self.__records = BattleRecord(self.player1.player_name, self.player2.player_name)
+        self.__records.open(self.record_file_name(round_))
+        self.player1.set_record(self.__records)
+        self.player2.set_record(self.__records)
         try:
             turn = 1
-            print(f'turn {turn}.')
+            self.log(f'turn {turn}.')
             # init view
             await self.__view.post_result('')
             await self.print_board()
@@ -112,8 +195,8 @@ class Master:
                 turn += 1
                 current_player = self.__p1 if self.__turn == Turn.Player1 else self.__p2
 
-                print(f'turn {turn}.')
-                print(f'player {current_player.player_number} action')
+                self.log(f'turn {turn}.')
+                self.log(f'player {current_player.player_number} action')
 
                 await self.turn_action(current_player)
                 await self.print_board()
@@ -129,8 +212,9 @@ class Master:
             print(e)
 
         await self.print_winner(winner, finished_reason)
-        self.__records.add_result(winner)
-        self.__records.output(self.log_file_name(round_))
+        self.__records.add_result(winner, finished_reason)
+        self.__records.close()
+        self.__games.append(self.__records)
         return winner.player_name if winner is not None else None
 
     async def first_turn(self):
@@ -138,42 +222,112 @@ class Master:
         await self.print_board()
         await self.first_turn_action(self.player2)
 
-    async def first_turn_action(self, player: Player):
+    async def request_action(self, player: Player, first: bool = False) -> Tuple[Block, Position]:
+        """
+        盤面を送って手を受け取る。持ち時間・1手の上限を超えたらasyncio.TimeoutError
+        """
+        clock = self.__clocks[player.player_number]
+        timeout = clock.move_limit()
+        name = player.player_name
+        self.__mover = name
+        status = []
+        with self.__timing.measure(name, 'status'):
+            if ClockFeature in player.features:
+                status.append(self.clock_status(player))
+            if MovesFeature in player.features:
+                status.append(self.moves_status(player, first))
+
         async def action() -> Tuple[Block, Position]:
-            await player.send_board(self.board)
-            return await player.recv_input()
+            with self.__timing.measure(name, 'send_board'):
+                await player.send_board(self.board, status)
+            # クライアントの思考時間と通信を含む
+            with self.__timing.measure(name, 'recv_input'):
+                return await player.recv_input()
+
+        start = time.perf_counter()
+        try:
+            block, position = await asyncio.wait_for(action(), None if math.isinf(timeout) else timeout)
+        finally:
+            elapsed = time.perf_counter() - start
+            if not math.isinf(timeout):
+                self.__timing.add_limit_usage(name, elapsed / timeout)
+        # 同じプロセス内のクライアントは途中で止められないので、ここでも時間を確認する
+        if not clock.consume(elapsed):
+            raise asyncio.TimeoutError()
+        return block, position
+
+    def clock_status(self, player: Player) -> str:
+        """
+        clock拡張で盤面の後に送る行: "clock 自分の残り時間 相手の残り時間 この手の上限"
+        """
+        own = self.__clocks[player.player_number]
+        opponent = self.__clocks[3 - player.player_number]
+        return f'clock {own.remaining:.3f} {opponent.remaining:.3f} {own.move_limit():.3f}'
+
+    def moves_status(self, player: Player, first: bool) -> str:
+        """
+        moves拡張で盤面の後に送る行: "moves 手 手 ..."（形が重複する向きは1つにまとめる）
+        """
+        moves = self.board.legal_moves(player, player.usable_blocks(), first)
+        return ' '.join(['moves', *[PlacementTable.action(*move) for move in moves.tolist()]])
 
+    async def first_turn_action(self, player: Player):
         try:
-            block, position = await asyncio.wait_for(action(), TIMEOUT_SEC)
-            player.use_block(block)
-            self.board.try_place_first_block(player, block, position)
+            block, position = await self.request_action(player, True)
+            self.__last_move = (player.player_number, Master.action_string(block, position))
+            with self.__timing.measure(player.player_name, 'validate'):
+                player.use_block(block)
+                self.board.try_place_first_block(player, block, position)
 
         except Exception as e:
             print(e)
+            player.discard()
             raise GameFinishedException(self.get_winner(loser=player), FinishedReason.illegal_placement)
 
     async def turn_action(self, player: Player):
         if not player.active:
             return
-
-        async def action() -> Tuple[Block, Position]:
-            await player.send_board(self.board)
-            return await player.recv_input()
+        with self.__timing.measure(player.player_name, 'legal_check'):
+            has_legal_move = self.board.has_legal_move(player)
+        if not has_legal_move:
+            await self.auto_pass(player)
+            return
 
         try:
-            block, position = await asyncio.wait_for(action(), TIMEOUT_SEC)
-            print(block.block_type)
-            print(position.x)
-            print(position.y)
+            block, position = await self.request_action(player)
+            self.__last_move = (player.player_number, Master.action_string(block, position))
+            self.log(block.block_type)
+            self.log(position.x)
+            self.log(position.y)
             if not block.block_type == BlockType.X:
-                player.use_block(block)
-                self.board.try_place_block(player, block, position)
+                with self.__timing.measure(player.player_name, 'validate'):
+                    player.use_block(block)
+                    self.board.try_place_block(player, block, position)
             else:
                 player.active = False
         except Exception as e:
             print(e)
+            player.discard()
             raise GameFinishedException(self.get_winner(loser=player), FinishedReason.illegal_placement)
 
+    async def auto_pass(self, player: Player):
+        """
+        置ける手が残っていないplayerを、クライアントに盤面を送らずにパスさせる
+        """
+        self.log(f'player {player.player_number} has no legal move. pass.')
+        self.__records.add_record(player, 'X000')
+        player.active = False
+        if not player.reusable:
+            # パスを送って終了するはずだったクライアントには、接続を閉じて終了させる
+            await player.close()
+
+    @staticmethod
+    def action_string(block: Block, position: Position) -> str:
+        """
+        プレイヤーが送った手の文字列（例: U034）に戻す。Positionは0始まりなので1を足す
+        """
+        return f'{block.block_type.value}{block.block_rotation.value}{position.x + 1:X}{position.y + 1:X}'
+
     def get_winner(self, loser: Optional[Player]):
         if loser:
             return self.player1 if loser.player_number == 2 else self.player2
@@ -191,8 +345,11 @@ class Master:
             return self.player2
 
     async def print_board(self):
-        print(self.board.to_print_string())
-        await self.__view.post_view(self.player1, self.player2, self.board, self.__score)
+        with self.__timing.measure(self.__mover, 'print'):
+            self.log(self.board.to_print_string())
+        move, self.__last_move = self.__last_move, None
+        with self.__timing.measure(self.__mover, 'view'):
+            await self.__view.post_view(self.player1, self.player2, self.board, self.__score, move)
 
     async def print_score(self):
         print(f'finished.')
@@ -210,24 +367,47 @@ class Master:
 
         await self.__view.post_win(winner, finished_reason)
 
-    def log_file_name(self, round_: int) -> str:
-        return '_'.join([name for name in self.__score]) + f'_{round_}.log'
+    def log(self, *args):
+        if not self.__quiet:
+            print(*args)
+
+    def file_prefix(self) -> str:
+        """
+        棋譜などのファイル名の先頭。プレイヤー名はクライアントのパスのこともあるので、ファイル名に使えない文字を置き換える
+        試合番号があれば先頭に付け、同じ組み合わせの試合（繰り返しや並列の試合）が互いのファイルを上書きしないようにする
+        """
+        names = [re.sub(r'[^\w.-]+', '-', name).strip('-') for name in self.__score]
+        if self.__match_id is not None:
+            names.insert(0, f'match{self.__match_id}')
+        return '_'.join(names)
+
+    def record_file_name(self, round_: int) -> str:
+        return self.file_prefix() + f'_{round_}.replay'
+
+    def timing_file_name(self) -> str:
+        return self.file_prefix() + '_timing.json'
 
 
 def main():
     player1_target = sys.argv[1]
     player2_target = sys.argv[2]
     mode = ""
-    if len(sys.argv) == 4:
+    if len(sys.argv) >= 4:
         mode = sys.argv[3]
+    # 持ち時間（例: 300+2/10）。省略時は1手10秒のみ
+    time_control: Optional[TimeControl] = None
+    if len(sys.argv) >= 5:
+        time_control = TimeControl.parse(sys.argv[4])
 
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    server = WebsocketServer(loop)
-
-    loop.run_until_complete(server.start())
+    server: Optional[WebsocketServer] = None
+    if mode != HEADLESS_MODE:
+        server = WebsocketServer(loop)
+        loop.run_until_complete(server.start())
     try:
-        master = loop.run_until_complete(Master.create_game(server, player1_target, player2_target, loop, mode))
+        master = loop.run_until_complete(Master.create_game(server, player1_target, player2_target, loop, mode,
+                                                            time_control))
         loop.run_until_complete(master.start_match())
     except SystemExit:
         print('game close')
@@ -235,7 +415,8 @@ def main():
         print(e)
 
     finally:
-        server.stop()
+        if server is not None:
+            server.stop()
         loop.stop()
 
 
@@ -0,0 +1,57 @@
+from __future__ import annotations
+import asyncio
+import contextlib
+import importlib
+import os
+from typing import Any, Optional
+
+
+class LocalConnection:
+    """
+    websocketの代わりに、同じプロセス内のクライアント（create_action(board_str)を持つオブジェクト）とやり取りする
+    targetは 'module:Class' の形式（Classを省略するとPlayerClient）
+    クライアントのクラス属性 features で、websocketのクエリと同じようにプロトコル拡張を要求できる
+    """
+
+    def __init__(self, target: str, quiet: bool = True):
+        self.__client_class = LocalConnection.load(target)
+        self.__quiet = quiet
+        self.__client: Optional[Any] = None
+        self.__board: Optional[str] = None
+
+    @property
+    def features(self) -> set[str]:
+        return set(getattr(self.__client_class, 'features', ()))
+
+    @staticmethod
+    def load(target: str):
+        module_name, _, class_name = target.partition(':')
+        return getattr(importlib.import_module(module_name), class_name or 'PlayerClient')
+
+    async def send(self, message: str):
+        if message[:1].isdigit():
+            # 席番号（例: "1", "2 persistent"）。ネットワーク越しのクライアントと同じ順でクライアントを作る
+            player_number = int(message.partition(' ')[0])
+            if self.__client is not None and hasattr(self.__client, 'new_game'):
+                self.__client.new_game(player_number)
+            else:
+                self.__client = self.__client_class(player_number, None, asyncio.get_event_loop())
+            return
+
+        self.__board = message
+
+    async def recv(self) -> str:
+        # 手を考えるのは受け取るとき（websocketと同じく、思考時間がrecvの待ち時間になるように）
+        board, self.__board = self.__board, None
+        with self.__output():
+            return self.__client.create_action(board)
+
+    async def close(self):
+        pass
+
+    def __output(self):
+        # quietのときはクライアントのprintを捨てる（捨て先のファイルはwithを抜けるときに閉じる）
+        stack = contextlib.ExitStack()
+        if self.__quiet:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+        return stack
@@ -0,0 +1,106 @@
+from __future__ import annotations
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+import numpy as np
+
+# 有効にするときに、止まったとみなす時間（ミリ秒）を指定する環境変数
+WATCHDOG_ENV = 'BLOCKSDUO_WATCHDOG_MS'
+# 記録するスタックの最大数（回数はこれを超えても数える）
+MAX_STALLS = 20
+
+
+class LoopWatchdog:
+    """
+    イベントループの遅れを測り、threshold秒以上ループを止めた処理のスタックを記録する
+    ループ上の心拍（call_later）の遅れを測り、別スレッドが心拍が途絶えたのを見つけたら
+    その時点のループのスレッドのスタックを取る
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float):
+        self.__loop = loop
+        self.__threshold = threshold
+        self.__interval = max(threshold / 4, 0.005)
+        self.__lock = threading.Lock()
+        self.__running = False
+        self.__loop_thread_id: Optional[int] = None
+        self.__handle: Optional[asyncio.TimerHandle] = None
+        self.__thread: Optional[threading.Thread] = None
+        # 次の心拍が動くはずの時刻
+        self.__expected = 0.0
+        self.__lags: list[float] = []
+        self.__stalls: list[dict] = []
+        self.__stall_count = 0
+        # 記録中（まだループが止まっている）の停止
+        self.__current: Optional[dict] = None
+
+    def start(self):
+        """
+        ループのスレッド（コルーチンの中など）から呼ぶ
+        """
+        if self.__running:
+            return
+        self.__running = True
+        self.__loop_thread_id = threading.get_ident()
+        self.__expected = time.perf_counter()
+        self.__handle = self.__loop.call_soon(self.__beat)
+        self.__thread = threading.Thread(target=self.__watch, name='loop-watchdog', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        if not self.__running:
+            return
+        self.__running = False
+        self.__handle.cancel()
+        self.__thread.join()
+        with self.__lock:
+            self.__end_stall(time.perf_counter() - self.__expected)
+
+    def __beat(self):
+        now = time.perf_counter()
+        lag = max(0.0, now - self.__expected)
+        with self.__lock:
+            self.__lags.append(lag)
+            self.__end_stall(lag)
+            self.__expected = now + self.__interval
+        if self.__running:
+            self.__handle = self.__loop.call_later(self.__interval, self.__beat)
+
+    def __end_stall(self, lag: float):
+        if self.__current is not None:
+            self.__current['lag_ms'] = round(lag * 1000, 3)
+            self.__current = None
+
+    def __watch(self):
+        while self.__running:
+            time.sleep(self.__interval)
+            with self.__lock:
+                if self.__current is not None or time.perf_counter() - self.__expected < self.__threshold:
+                    continue
+                # ループを止めている処理のスタック
+                frame = sys._current_frames().get(self.__loop_thread_id)
+                stall = {'lag_ms': None, 'stack': ''.join(traceback.format_stack(frame)) if frame else ''}
+                self.__current = stall
+                self.__stall_count += 1
+                if len(self.__stalls) < MAX_STALLS:
+                    self.__stalls.append(stall)
+
+    def summary(self) -> dict:
+        """
+        ループの遅れのp50/p95/max（ミリ秒）と、threshold以上止まった回数・そのときのスタック
+        """
+        with self.__lock:
+            lags = np.array(self.__lags or [0.0]) * 1000
+            p50, p95 = np.percentile(lags, [50, 95])
+            return {
+                'threshold_ms': round(self.__threshold * 1000, 3),
+                'lag_p50_ms': round(float(p50), 3),
+                'lag_p95_ms': round(float(p95), 3),
+                'lag_max_ms': round(float(lags.max()), 3),
+                'stall_count': self.__stall_count,
+                'stalls': [dict(stall) for stall in self.__stalls],
+            }
@@ -0,0 +1,142 @@
+from __future__ import annotations
+import argparse
+import os
+import sqlite3
+from typing import Optional
+
+import numpy as np
+
+from blocks_duo.PlacementTable import Pieces
+
+# クライアントが読む定跡ファイルのパスを指定する環境変数
+BOOK_ENV = 'BLOCKSDUO_BOOK'
+
+# 定跡ファイルの1行: 局面のキー, 手 (piece, rotation, x, y), その手が指されたゲーム数, 指した側が勝ったゲーム数
+BookDtype = np.dtype([
+    ('key', '<u8'),
+    ('piece', 'u1'),
+    ('rotation', 'u1'),
+    ('x', 'u1'),
+    ('y', 'u1'),
+    ('games', '<u4'),
+    ('wins', '<u4'),
+])
+
+_Query = '''
+SELECT m.position_key, m.piece, m.rotation, m.x, m.y, COUNT(*), SUM(g.winner = m.seat)
+FROM moves AS m JOIN games AS g ON g.id = m.game_id
+WHERE m.ply <= ? AND m.piece != 'X'
+GROUP BY m.position_key, m.piece, m.rotation, m.x, m.y
+HAVING COUNT(*) >= ?
+'''
+
+
+class OpeningBook:
+    """
+    アーカイブ（Archive）のゲームから作る、局面のキー -> 手の統計の表
+    ファイルはキー順（同じキーの中では良い手から順）に並べたnumpyの構造化配列で、mmapで読む
+    キーはZobrist.position_key（盤面のセルと手番）
+    """
+
+    __default: Optional[OpeningBook] = None
+    __default_loaded = False
+
+    def __init__(self, entries: np.ndarray):
+        self.__entries = entries
+        self.__keys = entries['key']
+
+    @property
+    def entries(self) -> np.ndarray:
+        return self.__entries
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    @staticmethod
+    def load(path: str) -> OpeningBook:
+        return OpeningBook(np.load(path, mmap_mode='r'))
+
+    @staticmethod
+    def default() -> Optional[OpeningBook]:
+        """
+        環境変数 BLOCKSDUO_BOOK の定跡（指定がない・読めなければNone）。プロセスで1回だけ読む
+        """
+        if not OpeningBook.__default_loaded:
+            OpeningBook.__default_loaded = True
+            path = os.environ.get(BOOK_ENV)
+            if path:
+                try:
+                    OpeningBook.__default = OpeningBook.load(path)
+                except (OSError, ValueError) as e:
+                    print(f'opening book: {e}')
+        return OpeningBook.__default
+
+    def lookup(self, key: int) -> np.ndarray:
+        """
+        局面のキーに登録されている手を、良い順に (piece, rotation, x, y) の行の配列で返す
+        """
+        start = np.searchsorted(self.__keys, np.uint64(key), side='left')
+        end = np.searchsorted(self.__keys, np.uint64(key), side='right')
+        found = self.__entries[start:end]
+        return np.stack([found['piece'], found['rotation'], found['x'], found['y']], axis=1).astype(np.int8)
+
+    def best_move(self, key: int, legal_moves: np.ndarray) -> Optional[list[int]]:
+        """
+        legal_movesに含まれる手のうち、定跡で一番良い手（なければNone）
+        キーには使用済みブロックが含まれないので、合法手かどうかはここで確かめる
+        """
+        legal = {tuple(move) for move in legal_moves.tolist()}
+        for move in self.lookup(key).tolist():
+            if tuple(move) in legal:
+                return move
+        return None
+
+    @staticmethod
+    def build(archive: str, plies: int, min_games: int = 1) -> np.ndarray:
+        """
+        archiveのplies手目までの手を集計して定跡の配列を作る
+        同じキーの中では、勝率（(勝ち + 1) / (ゲーム数 + 2)）の高い順、同じならゲーム数の多い順に並べる
+        """
+        connection = sqlite3.connect(archive)
+        try:
+            rows = connection.execute(_Query, (plies, min_games)).fetchall()
+        finally:
+            connection.close()
+
+        entries = np.empty(len(rows), dtype=BookDtype)
+        if rows:
+            keys, pieces, rotations, xs, ys, games, wins = zip(*rows)
+            # SQLiteには符号付きで入っているので、同じビット列の符号なしの値に戻す
+            entries['key'] = np.array(keys, dtype=np.int64).view(np.uint64)
+            entries['piece'] = [Pieces.index(piece) for piece in pieces]
+            entries['rotation'] = rotations
+            entries['x'] = xs
+            entries['y'] = ys
+            entries['games'] = games
+            entries['wins'] = wins
+        rate = (entries['wins'] + 1.0) / (entries['games'] + 2.0)
+        order = np.lexsort((-entries['games'].astype(np.int64), -rate, entries['key']))
+        return entries[order]
+
+    @staticmethod
+    def save(entries: np.ndarray, path: str):
+        # np.loadでそのまま読めるよう、拡張子を付け足されないようにファイルオブジェクトで書く
+        with open(path, mode='wb') as fp:
+            np.save(fp, entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='build a blocks duo opening book from a game archive')
+    parser.add_argument('archive', help='SQLite database written by the tournament or replay command')
+    parser.add_argument('-o', '--output', default='opening_book.npy', help='book file to write')
+    parser.add_argument('-p', '--plies', type=int, default=8, help='number of plies from the start to include')
+    parser.add_argument('-m', '--min-games', type=int, default=1, help='ignore moves played in fewer games')
+    args = parser.parse_args()
+
+    entries = OpeningBook.build(args.archive, args.plies, args.min_games)
+    OpeningBook.save(entries, args.output)
+    print(f'{len(entries)} entries, {len(np.unique(entries["key"]))} positions -> {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+from __future__ import annotations
+import contextlib
+import json
+import time
+
+import numpy as np
+
+# 1手の上限のこの割合以上を使った手を「時間切れ寸前」として数える
+NEAR_TIMEOUT = 0.8
+
+
+class PhaseTimer:
+    """
+    ターンの処理（盤面の送信、クライアントの応答待ち、置けるかの確認、表示など）にかかった時間を
+    プレイヤーごと・処理ごとに time.perf_counter_ns で集める
+    """
+
+    def __init__(self):
+        # プレイヤー名 -> 処理名 -> かかった時間(ns)の一覧
+        self.__samples: dict[str, dict[str, list[int]]] = {}
+        # プレイヤー名 -> 応答待ちが1手の上限に占めた割合の一覧
+        self.__limit_usage: dict[str, list[float]] = {}
+
+    def add(self, name: str, phase: str, elapsed_ns: int):
+        self.__samples.setdefault(name, {}).setdefault(phase, []).append(elapsed_ns)
+
+    def add_limit_usage(self, name: str, usage: float):
+        self.__limit_usage.setdefault(name, []).append(usage)
+
+    @contextlib.contextmanager
+    def measure(self, name: str, phase: str):
+        """
+        withの中の処理にかかった時間を記録する（例外で抜けたときも記録する）
+        """
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add(name, phase, time.perf_counter_ns() - start)
+
+    def summary(self) -> dict:
+        """
+        プレイヤーごと・処理ごとの回数、合計、p50/p95/max（ミリ秒）
+        """
+        ret = {}
+        for name, phases in self.__samples.items():
+            player = {}
+            for phase, samples in phases.items():
+                ms = np.array(samples, dtype=np.float64) / 1e6
+                p50, p95 = np.percentile(ms, [50, 95])
+                player[phase] = {
+                    'count': len(samples),
+                    'total_ms': round(float(ms.sum()), 3),
+                    'p50_ms': round(float(p50), 3),
+                    'p95_ms': round(float(p95), 3),
+                    'max_ms': round(float(ms.max()), 3),
+                }
+            usage = self.__limit_usage.get(name)
+            if usage:
+                player['move_limit'] = {
+                    'max_used': round(max(usage), 3),
+                    'near_timeout': sum(1 for u in usage if u >= NEAR_TIMEOUT),
+                }
+            ret[name] = player
+        return ret
+
+    def output(self, target: str, **extra):
+        """
+        summaryをJSONでtargetに書き出す。extraは一緒に書いておく情報（対戦者、スコア等）
+        """
+        with open(target, mode='w') as fp:
+            json.dump({**extra, 'players': self.summary()}, fp, ensure_ascii=False, indent=2)
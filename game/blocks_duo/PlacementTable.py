@@ -0,0 +1,174 @@
+from __future__ import annotations
+from typing import NamedTuple, Iterable
+
+import numpy as np
+
+from blocks_duo.BitBoard import BitBoard, BOARD_SIZE, STRIDE
+from blocks_duo.Block import Block
+from blocks_duo.BlockRotation import BlockRotation
+from blocks_duo.BlockType import BlockType
+from blocks_duo.Position import Position
+
+# legal_moves等が返す手の行の piece は、この並びでのインデックス
+Pieces = [b.value for b in BlockType]
+
+
+class Placement(NamedTuple):
+    block: Block
+    x: int
+    y: int
+    # ブロックが占めるセル
+    bits: int
+    # ブロックに辺で接するセル
+    edge_bits: int
+    # ブロックに角だけで接するセル
+    corner_bits: int
+    # now_board()上のセル位置（flat index）
+    cells: tuple[int, ...]
+    # PlacementTable.moves等での行番号
+    row: int
+
+
+class PlacementTable:
+    """
+    全ての (BlockType, BlockRotation, Position) についてのマスクをimport時に一度だけ作っておく
+    キーはBlockType/BlockRotationの値なので、ss_player側のenumからも引ける
+    movesには形が重複しない向き（Block.orientations）の手だけを並べる
+    """
+
+    blocks: dict[tuple[str, int], Block] = {}
+    placements: dict[tuple[str, int, int, int], Placement] = {}
+    # 行番号順のPlacement（placementsから対称で重複する向きを除いたもの）
+    rows: list[Placement]
+
+    # 以下はplacementsと同じ順番に並べた配列（numpyで一度に判定する用）
+    # 手の行: (piece, rotation, x, y)、x, yはPositionに渡す1始まりの座標
+    moves: np.ndarray
+    block_words: np.ndarray
+    edge_words: np.ndarray
+    corner_words: np.ndarray
+    # セル位置（flat index）ごとの、そのセルを覆う手の行番号（昇順）
+    covering: list[np.ndarray]
+
+    @staticmethod
+    def block(block_type: str, block_rotation: int) -> Block:
+        return PlacementTable.blocks[(block_type, block_rotation)]
+
+    @staticmethod
+    def lookup(block: Block, position: Position) -> Placement:
+        key = (block.block_type.value, block.block_rotation.value, position.x, position.y)
+        placement = PlacementTable.placements.get(key)
+        if placement is None:
+            raise ValueError("invalid position")
+        return placement
+
+    @staticmethod
+    def placement_of(piece: int, block_rotation: int, x: int, y: int) -> Placement:
+        """
+        手の行 (piece, rotation, x, y) に対応するPlacement
+        """
+        return PlacementTable.placements[(Pieces[piece], block_rotation, x - 1, y - 1)]
+
+    @staticmethod
+    def block_of(piece: int, block_rotation: int) -> Block:
+        return PlacementTable.blocks[(Pieces[piece], block_rotation)]
+
+    @staticmethod
+    def action(piece: int, block_rotation: int, x: int, y: int) -> str:
+        """
+        手の行をサーバへ送る文字列（例: U034）にする
+        """
+        return f'{Pieces[piece]}{block_rotation}{x:X}{y:X}'
+
+    @staticmethod
+    def parse_actions(actions: Iterable[str]) -> np.ndarray:
+        """
+        actionの逆変換。手の文字列（例: U034）の並びを手の行の配列にする
+        :return: shape (手の数, 4) のint8配列
+        """
+        return np.array([(Pieces.index(a[0]), int(a[1]), int(a[2], 16), int(a[3], 16)) for a in actions],
+                        dtype=np.int8).reshape(-1, 4)
+
+    @staticmethod
+    def piece_mask(usable_blocks: Iterable) -> np.ndarray:
+        """
+        Piecesの並びで、使えるブロックだけTrueになるマスク
+        """
+        usable = np.zeros(len(Pieces), dtype=bool)
+        usable[[Pieces.index(b.value) for b in usable_blocks]] = True
+        return usable
+
+    @staticmethod
+    def usable_mask(usable_blocks: Iterable) -> np.ndarray:
+        """
+        使えるブロックの手の行だけTrueになるマスク
+        """
+        return PlacementTable.piece_mask(usable_blocks)[PlacementTable.moves[:, 0]]
+
+    @staticmethod
+    def covering_rows(cells: list[int]) -> np.ndarray:
+        """
+        cellsのどれかを覆う手の行番号（重複なし、昇順）
+        """
+        if len(cells) == 1:
+            return PlacementTable.covering[cells[0]]
+        return np.unique(np.concatenate([PlacementTable.covering[cell] for cell in cells]))
+
+    @staticmethod
+    def _build():
+        aliases = []
+        for block_type in BlockType:
+            orientations = Block.orientations(block_type)
+            for block_rotation in BlockRotation:
+                block = Block(block_type, block_rotation)
+                PlacementTable.blocks[(block_type.value, block_rotation.value)] = block
+                if block_type == BlockType.X:
+                    continue
+                if block not in orientations:
+                    # 対称で同じ形になる向きは、代表の向きのPlacementを共有する
+                    same = next(b for b in orientations if np.array_equal(b.block_map, block.block_map))
+                    aliases.append((block, same))
+                    continue
+
+                block_cells = [(int(x), int(y)) for y, x in zip(*block.block_map.nonzero())]
+                origin_bits = 0
+                for x, y in block_cells:
+                    origin_bits |= BitBoard.bit(x, y)
+                origin_cells = [y * BOARD_SIZE + x for x, y in block_cells]
+
+                for y in range(0, BOARD_SIZE - block.shape_y + 1):
+                    for x in range(0, BOARD_SIZE - block.shape_x + 1):
+                        bits = origin_bits << (y * STRIDE + x)
+                        edge_bits = BitBoard.edge_neighbours(bits) & ~bits
+                        corner_bits = BitBoard.corner_neighbours(bits) & ~edge_bits & ~bits
+                        cells = tuple([y * BOARD_SIZE + x + cell for cell in origin_cells])
+                        PlacementTable.placements[(block_type.value, block_rotation.value, x, y)] = \
+                            Placement(block, x, y, bits, edge_bits, corner_bits, cells,
+                                      len(PlacementTable.placements))
+
+        placements = list(PlacementTable.placements.values())
+        piece_index = {piece: i for i, piece in enumerate(Pieces)}
+        PlacementTable.moves = np.array(
+            [(piece_index[p.block.block_type.value], p.block.block_rotation.value, p.x + 1, p.y + 1)
+             for p in placements], dtype=np.int8)
+        PlacementTable.block_words = BitBoard.to_words_array([p.bits for p in placements])
+        PlacementTable.edge_words = BitBoard.to_words_array([p.edge_bits for p in placements])
+        PlacementTable.corner_words = BitBoard.to_words_array([p.corner_bits for p in placements])
+
+        by_block = {}
+        for p in placements:
+            by_block.setdefault(p.block, []).append(p)
+        for block, same in aliases:
+            for p in by_block[same]:
+                PlacementTable.placements[(block.block_type.value, block.block_rotation.value, p.x, p.y)] = p
+        PlacementTable.rows = placements
+
+        rows = np.concatenate([np.full(len(p.cells), i) for i, p in enumerate(placements)])
+        cells = np.concatenate([p.cells for p in placements])
+        order = np.argsort(cells, kind='stable')
+        bounds = np.searchsorted(cells[order], np.arange(BOARD_SIZE * BOARD_SIZE + 1))
+        PlacementTable.covering = [rows[order[bounds[i]:bounds[i + 1]]]
+                                   for i in range(BOARD_SIZE * BOARD_SIZE)]
+
+
+PlacementTable._build()
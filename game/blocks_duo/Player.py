@@ -1,24 +1,42 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING, Tuple, Optional
+from typing import TYPE_CHECKING, Tuple, Optional, Iterable
 from websockets import WebSocketServerProtocol
 
 from blocks_duo.Block import Block
 from blocks_duo.BlockRotation import BlockRotation
 from blocks_duo.BlockType import BlockType
+from blocks_duo.PlacementTable import PlacementTable
 from blocks_duo.Position import Position
 
 if TYPE_CHECKING:
     from Board import Board
     from blocks_duo.BattleRecord import BattleRecord
 
+# 持ち駒のビット（BlockTypeの並び順）
+PieceBits = {b.value: 1 << i for i, b in enumerate(BlockType)}
+AllPieces = (1 << len(PieceBits)) - 1
+# パス用のXは使い切りの判定に含めない
+PlacablePieces = AllPieces & ~PieceBits[BlockType.X.value]
+
+# 接続を切らずに次の対戦でも使うクライアント（席番号のメッセージで新しい対戦が始まる）
+PersistentFeature = 'persistent'
+# 盤面の後に持ち時間の行（clock 自分 相手 この手の上限）を付ける
+ClockFeature = 'clock'
+# 盤面の後に置ける手の一覧の行（moves U034 A053 ...）を付ける
+MovesFeature = 'moves'
+
 
 class Player:
-    def __init__(self, player_number: int, target: str, player_name: str, connection: WebSocketServerProtocol):
+    def __init__(self, player_number: int, target: str, player_name: str, connection: WebSocketServerProtocol,
+                 features: Iterable[str] = ()):
         self.__target = target
         self.__player_name = player_name
         self.__player_number = player_number
-        self.__usable_blocks = [b for b in BlockType]
+        self.__usable_pieces = AllPieces
         self.__connection = connection
+        # クライアントが要求し、サーバが受け入れたプロトコル拡張
+        self.__features = frozenset(features)
+        self.__discarded = False
         self.__active = True
         self.__record: Optional[BattleRecord] = None
 
@@ -34,6 +52,33 @@ class Player:
     def player_name(self) -> str:
         return self.__player_name
     
+    @property
+    def features(self) -> frozenset[str]:
+        return self.__features
+
+    @property
+    def reusable(self) -> bool:
+        """
+        次の対戦でも接続を使い回せるか
+        """
+        return PersistentFeature in self.__features and not self.__discarded and \
+            getattr(self.__connection, 'open', True)
+
+    def discard(self):
+        """
+        応答が遅れて届く等で接続の状態が分からなくなったので、使い回さないようにする
+        """
+        self.__discarded = True
+
+    def reseat(self, player_number: int, player_name: str) -> Player:
+        """
+        同じ接続を使う、新しい対戦用のPlayer
+        """
+        return Player(player_number, self.__target, player_name, self.__connection, self.__features)
+
+    async def close(self):
+        await self.__connection.close()
+
     @property
     def active(self) -> bool:
         return self.__active
@@ -46,10 +91,17 @@ class Player:
         self.__record = record
 
     async def send_player_number(self):
-        await self.__connection.send(f'{self.player_number}')
+        if self.__features:
+            # 拡張を要求したクライアントには、受け入れた拡張も知らせる（例: "1 persistent"）
+            await self.__connection.send(f'{self.player_number} {",".join(sorted(self.__features))}')
+        else:
+            await self.__connection.send(f'{self.player_number}')
 
-    async def send_board(self, board: Board):
-        await self.__connection.send(board.to_print_string())
+    async def send_board(self, board: Board, status: Iterable[str] = ()):
+        """
+        盤面を送る。statusは拡張を要求したクライアント向けに盤面の後ろへ1行ずつ付ける
+        """
+        await self.__connection.send('\n'.join([board.to_print_string(), *status]))
 
     async def recv_input(self) -> Tuple[Block, Position]:
         player_request = await self.__connection.recv()
@@ -60,19 +112,34 @@ class Player:
         if self.__record:
             self.__record.add_record(self, player_request)
 
-        block_type = player_request[0]
-        block_rotation = int(player_request[1])
+        block_type = BlockType(player_request[0])
+        block_rotation = BlockRotation(int(player_request[1]))
         position_x = int(player_request[2], 16)
         position_y = int(player_request[3], 16)
-        return Block(BlockType(block_type), BlockRotation(block_rotation)), Position(position_x, position_y)
+        return PlacementTable.block(block_type.value, block_rotation.value), Position(position_x, position_y)
 
     def can_use_block(self, block: Block) -> bool:
-        return block.block_type in self.__usable_blocks
+        return (self.__usable_pieces & PieceBits[block.block_type.value]) != 0
 
     def use_block(self, block: Block):
-        if block.block_type not in self.__usable_blocks:
+        bit = PieceBits[block.block_type.value]
+        if not self.__usable_pieces & bit:
             raise ValueError("passed block is not usable.")
-        self.__usable_blocks.remove(block.block_type)
-    
+        self.__usable_pieces &= ~bit
+
+    @property
+    def usable_pieces(self) -> int:
+        """
+        使えるブロックのビットマスク（PieceBits）
+        """
+        return self.__usable_pieces
+
+    @property
+    def all_used(self) -> bool:
+        """
+        パス以外のブロックを全て使い切ったか
+        """
+        return (self.__usable_pieces & PlacablePieces) == 0
+
     def usable_blocks(self) -> list[BlockType]:
-        return self.__usable_blocks
+        return [b for b in BlockType if self.__usable_pieces & PieceBits[b.value]]
@@ -1,25 +1,41 @@
 import subprocess
+from typing import Iterable
 
 import asyncio
 import websockets
 
-from blocks_duo.Player import Player
+from blocks_duo.LocalConnection import LocalConnection
+from blocks_duo.Player import Player, PersistentFeature, ClockFeature, MovesFeature
 from blocks_duo.WebsocketServer import WebsocketServer
 
 
+# サーバが受け入れるプロトコル拡張
+Features = {PersistentFeature, ClockFeature, MovesFeature}
+
+
 class PlayerFactory:
+    # 対戦が終わって待機している、使い回せる接続（(id(server), target)ごと）
+    __idle: dict[tuple[int, str], list[Player]] = {}
+
     @staticmethod
     async def create(server: WebsocketServer, player_number: int, target: str, name: str, loop: asyncio.AbstractEventLoop):
+        idle = PlayerFactory.__idle.get((id(server), target), [])
+        while idle:
+            player = idle.pop()
+            if player.reusable:
+                return await PlayerFactory.reseat(player, player_number, name)
+
         future: asyncio.Future[Player] = loop.create_future()
 
-        def on_connect(socket: websockets.WebSocketServerProtocol):
-            player = Player(player_number, target, name, socket)
+        def on_connect(socket: websockets.WebSocketServerProtocol, features: set[str]):
+            player = Player(player_number, target, name, socket, features & Features)
 
             print(f'player: {player_number} connected')
-            future.set_result(player)
+            if not future.done():
+                future.set_result(player)
 
-        server.set_callback(on_connect)
-        loop.run_in_executor(None, PlayerFactory.start_client, target, server.server_url())
+        token = server.set_callback(on_connect)
+        PlayerFactory.start_client(target, server.server_url(token))
 
         try:
             player = await asyncio.wait_for(future, 20)
@@ -27,10 +43,40 @@ class PlayerFactory:
             print(f'player {player_number} was created.')
             return player
         finally:
-            server.clear_callback()
+            server.clear_callback(token)
+
+    @staticmethod
+    async def reseat(player: Player, player_number: int, name: str) -> Player:
+        """
+        persistentなクライアントの接続をそのまま使い、新しい席番号を送って次の対戦を始める
+        """
+        player = player.reseat(player_number, name)
+        await player.send_player_number()
+        print(f'player {player_number} was reseated.')
+        return player
+
+    @staticmethod
+    def release(server: WebsocketServer, players: Iterable[Player]):
+        """
+        対戦が終わったPlayerの接続を、次に同じtargetを作るときのために取っておく
+        """
+        for player in players:
+            if player.reusable:
+                PlayerFactory.__idle.setdefault((id(server), player.target), []).append(player)
+
+    @staticmethod
+    async def create_local(player_number: int, target: str, name: str, quiet: bool = True):
+        """
+        websocketもプロセスも使わず、同じプロセス内でクライアントを動かすPlayerを作る（headlessモード用）
+        """
+        connection = LocalConnection(target, quiet)
+        player = Player(player_number, target, name, connection, connection.features & Features)
+        await player.send_player_number()
+        return player
 
     @staticmethod
     def start_client(target: str, url: str):
         print(f'client_script={target}')
         args = [target, url]
-        subprocess.run(args)
+        # 終了を待たない（同時に多数の対戦を行ってもスレッドを占有しないように）
+        subprocess.Popen(args)
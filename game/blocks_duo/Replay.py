@@ -0,0 +1,171 @@
+from __future__ import annotations
+import argparse
+import multiprocessing
+import os
+import sys
+from typing import Iterable, Optional
+
+from blocks_duo.Archive import Archive
+from blocks_duo.BattleRecord import BattleRecord
+from blocks_duo.BlockType import BlockType
+from blocks_duo.Board import Board
+from blocks_duo.FinishedReason import FinishedReason
+from blocks_duo.PlacementTable import PlacementTable
+from blocks_duo.Player import Player
+from blocks_duo.Position import Position
+
+RECORD_SUFFIX = '.replay'
+
+
+def validate(record: BattleRecord) -> dict:
+    """
+    棋譜の手を順にルールエンジンで置き直し、手番・合法性・最終得点・勝敗が記録と一致するかを調べる
+    手番の進め方はGameMasterと同じ（初手は1, 2の順、以降は交互にパスした席を飛ばす）
+    :return: 再計算した結果と、見つかった不一致（errors）
+             keysは各手を指す前の局面のキー（Board.position_key）
+    """
+    board = Board()
+    players = {1: Player(1, '', record.player1_name, None), 2: Player(2, '', record.player2_name, None)}
+    errors: list[str] = []
+    keys: list[int] = []
+    illegal_seat: Optional[int] = None
+    turn = 1
+    n = 0
+
+    def next_seat() -> Optional[int]:
+        # 次に手を指すはずの席（両者ともパスしていればNone）
+        if n < 2:
+            return n + 1
+        for seat in (turn, 3 - turn):
+            if players[seat].active:
+                return seat
+        return None
+
+    for seat_str, action in record.records:
+        seat = next_seat()
+        if seat is None:
+            errors.append(f'move {n + 1}: {seat_str}:{action} after both players passed')
+            break
+        if int(seat_str) != seat:
+            errors.append(f'move {n + 1}: {seat_str}:{action} out of turn (expected player {seat})')
+            break
+        player = players[seat]
+        keys.append(board.position_key(seat))
+        n += 1
+        if n > 2:
+            turn = 3 - seat
+
+        try:
+            block = PlacementTable.block(action[0], int(action[1]))
+            position = Position(int(action[2], 16), int(action[3], 16))
+            if n > 2 and block.block_type == BlockType.X:
+                player.active = False
+                continue
+            player.use_block(block)
+            if n <= 2:
+                board.try_place_first_block(player, block, position)
+            else:
+                board.try_place_block(player, block, position)
+        except Exception as e:
+            # 反則の手で対戦は終わるので、これが最後の手のはず
+            illegal_seat = seat
+            if n != len(record.records):
+                errors.append(f'move {n}: {seat_str}:{action} is illegal ({e}) but the game continued')
+            break
+
+    points = [board.get_point(players[1]), board.get_point(players[2])]
+    if illegal_seat is not None:
+        winner, reason = 3 - illegal_seat, FinishedReason.illegal_placement
+    elif record.reason == FinishedReason.illegal_placement:
+        # 時間切れや切断は手が記録されないので、次に指すはずだった席の負けになっているかを見る
+        seat = next_seat()
+        winner, reason = (None, None) if seat is None else (3 - seat, FinishedReason.illegal_placement)
+    elif next_seat() is not None:
+        winner, reason = None, None
+        errors.append('game is not finished')
+    else:
+        winner = 0 if points[0] == points[1] else 1 if points[0] > points[1] else 2
+        reason = FinishedReason.normal
+
+    if not record.result:
+        errors.append('no result')
+    elif winner != record.winner or reason != record.reason:
+        errors.append(f'recorded winner {record.winner} ({record.reason.name}), '
+                      f'replayed {winner} ({reason.name if reason else "unknown"})')
+
+    return {
+        'moves': n,
+        'points': points,
+        'winner': winner,
+        'keys': keys,
+        'errors': errors,
+    }
+
+
+def _validate_file(path: str) -> dict:
+    record = None
+    try:
+        record = BattleRecord.read_record(path)
+        result = validate(record)
+    except Exception as e:
+        result = {'moves': 0, 'points': [], 'winner': None, 'errors': [f'cannot read: {e!r}']}
+    result['file'] = path
+    result['record'] = record
+    return result
+
+
+def record_files(paths: Iterable[str]) -> list[str]:
+    """
+    pathsの棋譜ファイル（ディレクトリは中の*.replayを再帰的に探す）
+    """
+    ret = []
+    for path in paths:
+        if not os.path.isdir(path):
+            ret.append(path)
+            continue
+        for root, _, files in os.walk(path):
+            ret.extend(os.path.join(root, f) for f in sorted(files) if f.endswith(RECORD_SUFFIX))
+    return ret
+
+
+def run(paths: Iterable[str], workers: int, verbose: bool = False, archive: Optional[str] = None) -> tuple[int, int]:
+    """
+    棋譜を並列に検証し、不一致のあったものを表示する
+    archiveを指定すると、不一致のなかった棋譜をSQLiteのデータベースに保存する
+    :return: (検証した棋譜の数, 不一致のあった棋譜の数)
+    """
+    files = record_files(paths)
+    mismatches = 0
+    db = Archive(archive) if archive else None
+    with multiprocessing.Pool(workers) as pool:
+        # 1ファイルは短時間で終わるので、まとめてワーカーに渡す
+        chunksize = max(1, min(256, len(files) // (workers * 4)))
+        for result in pool.imap_unordered(_validate_file, files, chunksize):
+            if result['errors']:
+                mismatches += 1
+                print(f'{result["file"]}: {"; ".join(result["errors"])}')
+                continue
+            if db is not None:
+                db.add_game(result['record'], result, source=result['file'])
+            if verbose:
+                print(f'{result["file"]}: ok {result["moves"]} moves, points {result["points"]}')
+    if db is not None:
+        db.close()
+    return len(files), mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='blocks duo replay validator')
+    parser.add_argument('paths', nargs='+', help=f'record files or directories (searched for *{RECORD_SUFFIX})')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('-v', '--verbose', action='store_true', help='also show records that match')
+    parser.add_argument('-a', '--archive', help='SQLite database to store the records that match')
+    args = parser.parse_args()
+
+    checked, mismatches = run(args.paths, args.workers, args.verbose, args.archive)
+    print(f'{checked} records, {mismatches} mismatches')
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
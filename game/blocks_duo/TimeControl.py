@@ -0,0 +1,41 @@
+from __future__ import annotations
+import math
+
+# 1手あたりの制限時間（秒）
+TIMEOUT_SEC = 10
+
+
+class TimeControl:
+    """
+    持ち時間の設定
+    budget: 1対戦で各プレイヤーが使える合計時間、increment: 1手指すごとに足す時間、move_limit: 1手の上限
+    """
+
+    def __init__(self, budget: float = math.inf, increment: float = 0.0, move_limit: float = TIMEOUT_SEC):
+        self.__budget = budget
+        self.__increment = increment
+        self.__move_limit = move_limit
+
+    @property
+    def budget(self) -> float:
+        return self.__budget
+
+    @property
+    def increment(self) -> float:
+        return self.__increment
+
+    @property
+    def move_limit(self) -> float:
+        return self.__move_limit
+
+    @staticmethod
+    def parse(spec: str) -> TimeControl:
+        """
+        "300" / "300+2" / "300+2/10" （持ち時間+加算/1手の上限）を読む
+        """
+        spec, _, move_limit = spec.partition('/')
+        budget, _, increment = spec.partition('+')
+        return TimeControl(float(budget), float(increment or 0), float(move_limit or TIMEOUT_SEC))
+
+    def __str__(self) -> str:
+        return f'{self.__budget:g}+{self.__increment:g}/{self.__move_limit:g}'
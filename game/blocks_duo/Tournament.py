@@ -0,0 +1,155 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Optional
+
+from blocks_duo.Archive import Archive
+from blocks_duo.GameMaster import Master, HEADLESS_MODE
+from blocks_duo.LoopWatchdog import WATCHDOG_ENV
+from blocks_duo.Replay import validate
+from blocks_duo.TimeControl import TimeControl
+from blocks_duo.WebsocketServer import PORT, WebsocketServer
+
+# ワーカープロセスごとの設定（_init_workerで設定する）
+_worker_port: Optional[int] = None
+_worker_mode = ''
+_worker_time_control: Optional[TimeControl] = None
+# 棋譜をアーカイブするときは、各ゲームの棋譜と再計算した結果も親プロセスへ返す
+_worker_archive = False
+# ワーカーの中で使い続けるイベントループとサーバ（persistentなクライアントを対戦をまたいで使い回すため）
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+_worker_server: Optional[WebsocketServer] = None
+
+
+def _init_worker(counter, base_port: int, mode: str, time_control: Optional[str], verbose: bool, archive: bool,
+                 watchdog_ms: Optional[float]):
+    global _worker_port, _worker_mode, _worker_time_control, _worker_loop, _worker_archive
+    if not verbose:
+        # 対戦の経過は表示せず、結果だけを親プロセスが表示する
+        sys.stdout = open(os.devnull, 'w')
+    # ワーカーごとに別のポートを使い、同時に複数の対戦ができるようにする
+    with counter.get_lock():
+        _worker_port = base_port + counter.value
+        counter.value += 1
+    _worker_mode = mode
+    _worker_time_control = TimeControl.parse(time_control) if time_control else None
+    _worker_archive = archive
+    if watchdog_ms:
+        os.environ[WATCHDOG_ENV] = str(watchdog_ms)
+    _worker_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker_loop)
+
+
+def _play_match(pairing: tuple[int, str, str]) -> dict:
+    global _worker_server
+    match_id, p1_target, p2_target = pairing
+    start = time.perf_counter()
+    score: dict[str, int] = {}
+    error = ''
+    master: Optional[Master] = None
+    try:
+        if _worker_mode != HEADLESS_MODE and _worker_server is None:
+            _worker_server = WebsocketServer(_worker_loop, _worker_port)
+            _worker_loop.run_until_complete(_worker_server.start())
+        master = _worker_loop.run_until_complete(
+            Master.create_game(_worker_server, p1_target, p2_target, _worker_loop, _worker_mode,
+                               _worker_time_control, match_id))
+        score = _worker_loop.run_until_complete(master.start_match())
+    except (Exception, SystemExit) as e:
+        error = repr(e)
+
+    result = {
+        'match': match_id,
+        'player1': p1_target,
+        'player2': p2_target,
+        'score': score,
+        'error': error,
+        'pid': os.getpid(),
+        'elapsed': round(time.perf_counter() - start, 3),
+    }
+    if _worker_archive:
+        # 局面のキーの計算もワーカーで済ませておく
+        result['games'] = [(record, validate(record)) for record in master.games] if master is not None else []
+    return result
+
+
+def pairings(targets: list[str], repeat: int = 1) -> list[tuple[int, str, str]]:
+    """
+    全ての組み合わせを、先手・後手を入れ替えた両方の順で対戦させる
+    """
+    ordered = [pair for _ in range(repeat) for pair in itertools.permutations(targets, 2)]
+    return [(i, p1, p2) for i, (p1, p2) in enumerate(ordered)]
+
+
+def run(targets: list[str], output: str, workers: int, mode: str = HEADLESS_MODE, repeat: int = 1,
+        base_port: int = PORT, time_control: Optional[str] = None, verbose: bool = False,
+        archive: Optional[str] = None, watchdog_ms: Optional[float] = None) -> dict[str, int]:
+    """
+    総当たり戦を行い、1試合終わるごとに結果をoutput（JSON Lines）に追記する
+    archiveを指定すると、各ゲームの棋譜をSQLiteのデータベースにも保存する
+    watchdog_msを指定すると、その時間以上イベントループを止めた処理を各試合のtiming.jsonに記録する
+    :return: targetごとの勝った試合数
+    """
+    wins = {target: 0 for target in targets}
+    counter = multiprocessing.Value('i', 0)
+    db = Archive(archive) if archive else None
+    with multiprocessing.Pool(workers, _init_worker,
+                              (counter, base_port, mode, time_control, verbose, db is not None,
+                               watchdog_ms)) as pool, \
+            open(output, mode='a') as fp:
+        for result in pool.imap_unordered(_play_match, pairings(targets, repeat)):
+            if db is not None:
+                match_id = db.add_match(result['player1'], result['player2'], output)
+                for round_, (record, replayed) in enumerate(result.pop('games'), 1):
+                    db.add_game(record, replayed, match_id, round_)
+            fp.write(json.dumps(result, ensure_ascii=False) + '\n')
+            fp.flush()
+
+            score = result['score']
+            names = list(score)
+            if len(names) == 2 and score[names[0]] != score[names[1]]:
+                winner = result['player1'] if score[names[0]] > score[names[1]] else result['player2']
+                wins[winner] += 1
+            print(f'match {result["match"]}: {result["player1"]} vs {result["player2"]} '
+                  f'{score} {result["error"]}')
+    if db is not None:
+        db.close()
+    return wins
+
+
+def main():
+    parser = argparse.ArgumentParser(description='blocks duo round-robin tournament')
+    parser.add_argument('targets', nargs='+',
+                        help='player targets (client command, or module:Class in headless mode)')
+    parser.add_argument('-o', '--output', default='tournament.jsonl', help='results file (JSON Lines, appended)')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('-m', '--mode', default=HEADLESS_MODE,
+                        help=f'"{HEADLESS_MODE}" runs clients in-process; anything else uses websockets')
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='number of times to play each pairing')
+    parser.add_argument('-p', '--base-port', type=int, default=PORT,
+                        help='first websocket port (worker i uses base-port + i)')
+    parser.add_argument('-t', '--time-control', help='per game time control, e.g. 300+2/10 (budget+increment/move limit)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='show the output of each match')
+    parser.add_argument('-a', '--archive', help='SQLite database to store every game (created if missing)')
+    parser.add_argument('-w', '--watchdog', type=float, metavar='MS',
+                        help='record event loop stalls longer than MS milliseconds (websocket mode only)')
+    args = parser.parse_args()
+
+    if len(set(args.targets)) != len(args.targets):
+        parser.error('targets must be unique')
+
+    wins = run(args.targets, args.output, args.workers, args.mode, args.repeat, args.base_port,
+               args.time_control, args.verbose, args.archive, args.watchdog)
+    print('finished.')
+    for target, count in sorted(wins.items(), key=lambda item: -item[1]):
+        print(f'{target}: {count}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,45 @@
-import asyncio
+import secrets
+import threading
+import time
+from collections import deque
 from typing import Optional
 
+import numpy as np
 import requests
 
 from blocks_duo.Board import Board
 from blocks_duo.FinishedReason import FinishedReason
 from blocks_duo.Player import Player
 
+# 表示が追いつかないときに溜めておく送信の最大数
+MAX_PENDING = 64
+# 差分をこの回数送ったら盤面全体（キーフレーム）を送り直す
+KEYFRAME_INTERVAL = 10
 
-class View:
 
-    def __init__(self, base_url: str):
+class View:
+    """
+    viewerへの送信はバックグラウンドのスレッドで行い、対戦を待たせない
+    送信待ちの盤面が続いたときは最新のものだけを送る（勝敗の送信は間引かない）
+    盤面を送った後はpace秒空けて次を送る（見やすくするため）
+    盤面は前回送ったものとの差分（変わったマス・使った駒・打った手）を送り、ときどき全体を送り直す
+    """
+
+    def __init__(self, base_url: str, pace: float = 2.0):
         self.__base_url = base_url
+        self.__pace = pace
+        # (url, request, 盤面かどうか)
+        self.__pending: deque[tuple[str, dict, bool]] = deque()
+        self.__condition = threading.Condition()
+        self.__closed = False
+        self.__sending = False
+        self.__thread: Optional[threading.Thread] = None
+        # viewerが複数の対戦の差分を区別するためのid
+        self.__match_id = secrets.token_hex(4)
+        # 以下は送信スレッドだけが使う。最後に届いた盤面と、その通し番号
+        self.__sent: Optional[dict] = None
+        self.__seq = 0
+        self.__deltas = 0
 
     @property
     def base_url(self) -> str:
@@ -25,15 +53,7 @@ class View:
         request = {
             'winName': result
         }
-        try:
-            response = requests.post(url, json=request)  # POSTリクエストを送信
-            if response.status_code == 200:
-                print('勝敗データが正常に送信されました。')
-            else:
-                print(f'エラー: {response.status_code}')
-            # viewモードの場合は待ちを入れる（見やすくするため）
-        except Exception as e:
-            print(e)
+        self.__publish(url, request, False)
 
     async def post_win(self, winner: Optional[Player], reason: FinishedReason):
         if self.base_url == '':
@@ -48,43 +68,145 @@ class View:
 
         await self.post_result(result)
 
-    async def post_view(self, player1: Player, player2: Player, board: Board, score: dict[str, int]):
+    async def post_view(self, player1: Player, player2: Player, board: Board, score: dict[str, int],
+                        move: Optional[tuple[int, str]] = None):
+        """
+        盤面を送る。moveはこの盤面になった手（プレイヤー番号, 'A034'のような手の文字列）
+        """
         if self.base_url == '':
             return
 
-        data = board.now_board().tolist()
-
         p1block_list = player1.usable_blocks()
         p1_data = [item.name for item in p1block_list]
 
         p2block_list = player2.usable_blocks()
         p2_data = [item.name for item in p2block_list]
-        url = self.base_url + '/blocksview'
-        request = {
+        # JSONへの変換は送信スレッドで行うので、ここでは盤面を複製しておくだけにする
+        snapshot = {
             'p1Name': player1.player_name,
             'p2Name': player2.player_name,
             'p1piece': p1_data,
             'p2piece': p2_data,
-            'board': data,
-            'score': {}
+            'board': board.now_board().copy(),
+            'score': dict(score),
+            'move': None if move is None else {'player': move[0], 'action': move[1]},
         }
 
-        for player_name in score:
-            request['score'][player_name] = score[player_name]
-
-        try:
-            response = requests.post(url, json=request)  # POSTリクエストを送信
-            if response.status_code == 200:
-                print('データが正常に送信されました。')
+        self.__publish(self.base_url + '/blocksview', snapshot, True)
+
+    def close(self, timeout: float = 10.0):
+        """
+        送信待ちを送り終えるまで（最大timeout秒）待ってスレッドを止める
+        """
+        with self.__condition:
+            self.__condition.wait_for(lambda: not self.__pending and not self.__sending, timeout)
+            self.__closed = True
+            self.__condition.notify_all()
+
+    def __publish(self, url: str, request: dict, is_board: bool):
+        with self.__condition:
+            if self.__closed:
+                return
+            if is_board and self.__pending and self.__pending[-1][2]:
+                # まだ送っていない盤面は新しい盤面で置き換える（複数の手をまとめた差分になるので手は送らない）
+                request['move'] = None
+                self.__pending[-1] = (url, request, is_board)
             else:
-                print(f'エラー: {response.status_code}')
-            # viewモードの場合は待ちを入れる（見やすくするため）
-        except Exception as e:
-            print(e)
-
-        await self.view_wait(2)
+                if len(self.__pending) >= MAX_PENDING:
+                    self.__drop_oldest()
+                self.__pending.append((url, request, is_board))
+            self.__condition.notify_all()
+
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name='view-publisher', daemon=True)
+                self.__thread.start()
+
+    def __drop_oldest(self):
+        for i, (_, _, is_board) in enumerate(self.__pending):
+            if is_board:
+                del self.__pending[i]
+                return
+        self.__pending.popleft()
+
+    def __run(self):
+        # 同じ接続を使い回す（keep-alive）
+        session = requests.Session()
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__pending or self.__closed)
+                if not self.__pending:
+                    break
+                url, request, is_board = self.__pending.popleft()
+                self.__sending = True
+
+            try:
+                if is_board:
+                    response = self.__post_board(session, url, request)
+                else:
+                    response = session.post(url, json=request, timeout=5)  # POSTリクエストを送信
+                if response.status_code == 200:
+                    print('データが正常に送信されました。' if is_board else '勝敗データが正常に送信されました。')
+                else:
+                    print(f'エラー: {response.status_code}')
+            except Exception as e:
+                print(e)
+
+            with self.__condition:
+                self.__sending = False
+                self.__condition.notify_all()
+            if is_board:
+                # 盤面は見やすいように間を空ける（対戦はその間も進む）
+                time.sleep(self.__pace)
+        session.close()
+
+    def __post_board(self, session: requests.Session, url: str, snapshot: dict) -> requests.Response:
+        self.__sent, sent = None, self.__sent
+        self.__seq += 1
+        response = None
+        if not self.__needs_keyframe(sent, snapshot):
+            response = session.post(url + '/delta', json=self.__delta(sent, snapshot), timeout=5)
+            self.__deltas += 1
+        if response is None or response.status_code != 200:
+            # viewerが前の盤面を持っていない（再起動したなど）ときも全体を送り直す
+            response = session.post(url, json=self.__keyframe(snapshot), timeout=5)
+            self.__deltas = 0
+        if response.status_code == 200:
+            self.__sent = snapshot
+        return response
+
+    def __needs_keyframe(self, sent: Optional[dict], snapshot: dict) -> bool:
+        if sent is None or self.__deltas >= KEYFRAME_INTERVAL:
+            return True
+        if sent['p1Name'] != snapshot['p1Name'] or sent['p2Name'] != snapshot['p2Name']:
+            return True
+        # 差分では駒を減らすことしかできない（新しい対戦で駒が戻ったときは全体を送る）
+        return not (set(snapshot['p1piece']) <= set(sent['p1piece']) and
+                    set(snapshot['p2piece']) <= set(sent['p2piece']))
+
+    def __keyframe(self, snapshot: dict) -> dict:
+        return {
+            'match': self.__match_id,
+            'seq': self.__seq,
+            'p1Name': snapshot['p1Name'],
+            'p2Name': snapshot['p2Name'],
+            'p1piece': snapshot['p1piece'],
+            'p2piece': snapshot['p2piece'],
+            'board': snapshot['board'].tolist(),
+            'score': snapshot['score'],
+        }
 
-    @staticmethod
-    async def view_wait(wait: int = 1):
-        await asyncio.sleep(wait)
-        
\ No newline at end of file
+    def __delta(self, sent: dict, snapshot: dict) -> dict:
+        board = snapshot['board']
+        ys, xs = np.nonzero(board != sent['board'])
+        request = {
+            'match': self.__match_id,
+            'seq': self.__seq,
+            'move': snapshot['move'],
+            # [y, x, 値] の組
+            'cells': np.stack([ys, xs, board[ys, xs]], axis=1).tolist(),
+            'p1removed': [name for name in sent['p1piece'] if name not in snapshot['p1piece']],
+            'p2removed': [name for name in sent['p2piece'] if name not in snapshot['p2piece']],
+        }
+        if snapshot['score'] != sent['score']:
+            request['score'] = snapshot['score']
+        return request
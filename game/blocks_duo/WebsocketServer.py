@@ -1,6 +1,8 @@
-from typing import Optional
+from typing import Callable, Optional
+from urllib.parse import urlsplit, parse_qs
 
 import asyncio
+import secrets
 import websockets
 
 DOMAIN = 'localhost'
@@ -8,11 +10,16 @@ PORT = 8088
 
 
 class WebsocketServer:
-    def __init__(self, loop: asyncio.AbstractEventLoop):
+    """
+    接続先URLのパス（/<token>）で、どの対戦のどの席への接続かを振り分ける
+    クエリの features=a,b でクライアントが要求するプロトコル拡張を受け取る
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, port: int = PORT):
         self._loop = loop
+        self.__port = port
         self.__server: Optional[websockets.WebSocketServer] = None
-        self.__ws_connect_callback = None
-        self.__server_loop = asyncio.new_event_loop()
+        self.__ws_connect_callbacks: dict[str, Callable[[websockets.WebSocketServerProtocol, set[str]], None]] = {}
 
     def __del__(self):
         self.stop()
@@ -20,21 +27,40 @@ class WebsocketServer:
     async def start(self):
         async def on_connect(websocket, path):
             # print(f'on_connect {websocket}')
-            if self.__ws_connect_callback:
-                self._loop.run_in_executor(None, self.__ws_connect_callback, websocket)
-                await self._loop.create_future()
+            callback = self.__ws_connect_callbacks.pop(WebsocketServer.token_of(path), None)
+            if callback is None:
+                await websocket.close(1008, 'unknown token')
+                return
+            callback(websocket, WebsocketServer.features_of(path))
+            # 対戦中は接続を保ち、クライアントが切断したら終える
+            await websocket.wait_closed()
 
-        self.__server = await websockets.serve(on_connect, DOMAIN, PORT)
+        self.__server = await websockets.serve(on_connect, DOMAIN, self.__port)
 
     def stop(self):
-        self.__server.close()
+        if self.__server is not None:
+            self.__server.close()
+
+    def set_callback(self, on_connect) -> str:
+        """
+        次にこのtokenで接続してきたクライアントをon_connectに渡す（1回限り）
+        :return: token
+        """
+        token = secrets.token_urlsafe(8)
+        self.__ws_connect_callbacks[token] = on_connect
+        return token
 
-    def set_callback(self, on_connect):
-        self.__ws_connect_callback = on_connect
+    def clear_callback(self, token: str):
+        self.__ws_connect_callbacks.pop(token, None)
 
-    def clear_callback(self):
-        self.__ws_connect_callback = None
+    @staticmethod
+    def token_of(path: str) -> str:
+        return urlsplit(path).path.strip('/')
 
     @staticmethod
-    def server_url() -> str:
-        return f'ws://{DOMAIN}:{PORT}'
+    def features_of(path: str) -> set[str]:
+        values = parse_qs(urlsplit(path).query).get('features', [])
+        return {feature for value in values for feature in value.split(',') if feature}
+
+    def server_url(self, token: str = '') -> str:
+        return f'ws://{DOMAIN}:{self.__port}/{token}'
@@ -0,0 +1,74 @@
+import numpy as np
+
+from blocks_duo.BitBoard import BOARD_SIZE
+from blocks_duo.PlacementTable import PlacementTable, Pieces
+
+# サーバ・クライアント・別プロセスで同じ値になるよう固定シードで作る
+_SEED = 0x5B1D0
+_CELLS = BOARD_SIZE * BOARD_SIZE
+
+
+class Zobrist:
+    """
+    盤面のハッシュ用の64bit乱数
+    ハッシュ = 各プレイヤーのセル ^ 使用済みブロック ^ (player 2の手番なら side)
+    プレイヤー番号でインデックスし、0番は未使用（全て0）
+    """
+
+    cells: list[list[int]]
+    # cellsと同じ値のnumpy配列（盤面全体を一度に引く用）
+    cell_array: np.ndarray
+    pieces: list[list[int]]
+    side: int
+    # PlacementTableの行ごとの、置いたセルのキーのXOR
+    placements: list[list[int]]
+
+    @staticmethod
+    def placement_key(player_number: int, row: int) -> int:
+        return Zobrist.placements[player_number][row]
+
+    @staticmethod
+    def piece_key(player_number: int, piece: int) -> int:
+        return Zobrist.pieces[player_number][piece]
+
+    @staticmethod
+    def cells_key(player_number: int, cells) -> int:
+        key = 0
+        for cell in cells:
+            key ^= Zobrist.cells[player_number][cell]
+        return key
+
+    @staticmethod
+    def position_key(cells_key: int, side_to_move: int) -> int:
+        """
+        局面のキー = セルのキー ^ (player 2の手番なら side)
+        使用済みブロックは盤面の文字列から分からないので含めない（クライアントも同じキーを計算できるように）
+        """
+        return cells_key ^ (Zobrist.side if side_to_move == 2 else 0)
+
+    @staticmethod
+    def board_key(board: np.ndarray) -> int:
+        """
+        now_board()の配列（0: 空き, 1/2: プレイヤー番号）全体のセルのキーのXOR
+        """
+        return int(np.bitwise_xor.reduce(Zobrist.cell_array[board.ravel(), np.arange(_CELLS)]))
+
+    @staticmethod
+    def _build():
+        rng = np.random.default_rng(_SEED)
+        cells = rng.integers(0, 2 ** 64, size=(3, _CELLS), dtype=np.uint64)
+        pieces = rng.integers(0, 2 ** 64, size=(3, len(Pieces)), dtype=np.uint64)
+        cells[0] = 0
+        pieces[0] = 0
+        Zobrist.cells = cells.tolist()
+        Zobrist.cell_array = cells
+        Zobrist.pieces = pieces.tolist()
+        Zobrist.side = int(rng.integers(0, 2 ** 64, dtype=np.uint64))
+
+        placement_cells = [p.cells for p in PlacementTable.rows]
+        flat_cells = np.concatenate(placement_cells)
+        starts = np.cumsum([0] + [len(c) for c in placement_cells[:-1]])
+        Zobrist.placements = [np.bitwise_xor.reduceat(cells[n][flat_cells], starts).tolist() for n in range(3)]
+
+
+Zobrist._build()
@@ -11,6 +11,9 @@ setup(
     entry_points={
         "console_scripts": [
             "start_blocksduo=blocks_duo.GameMaster:main",
+            "start_blocksduo_tournament=blocks_duo.Tournament:main",
+            "start_blocksduo_replay=blocks_duo.Replay:main",
+            "start_blocksduo_book=blocks_duo.OpeningBook:main",
         ]
     },
     classifiers=[
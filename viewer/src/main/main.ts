@@ -119,8 +119,41 @@ const createWindow = async () => {
 var http = express();
 http.use(bodyParser.json({limit: '50mb'}));
 
+//対戦(match)ごとに最後に受け取った盤面。差分はこれに適用する
+const MAX_VIEWS = 64;
+var views = new Map<string, any>();
+
+function storeView(view:any) {
+  views.delete(view.match);
+  views.set(view.match, view);
+  if (views.size > MAX_VIEWS) {
+    //一番古い対戦から捨てる
+    views.delete(views.keys().next().value);
+  }
+}
+
+//差分 {match, seq, move, cells:[[y, x, 値]], p1removed, p2removed, score?} を盤面に適用する
+function applyDelta(view:any, delta:any) :any {
+  var board = view.board.map((row:number[]) => row.slice());
+  for (const [y, x, value] of delta.cells) {
+    board[y][x] = value;
+  }
+  return {
+    ...view,
+    seq: delta.seq,
+    move: delta.move,
+    board: board,
+    p1piece: view.p1piece.filter((name:string) => !delta.p1removed.includes(name)),
+    p2piece: view.p2piece.filter((name:string) => !delta.p2removed.includes(name)),
+    score: delta.score ?? view.score,
+  };
+}
+
 http.post('/api/blocksview', (req:any, res:any) => {
   const receivedData = req.body;
+  if (receivedData.match !== undefined) {
+    storeView(receivedData);
+  }
   if (mainWindow){
     //受け取ったJsonボディーをレンダラーへ通知
     mainWindow.webContents.send("view-message", req.body);
@@ -130,6 +163,25 @@ http.post('/api/blocksview', (req:any, res:any) => {
   }
 });
 
+http.post('/api/blocksview/delta', (req:any, res:any) => {
+  const delta = req.body;
+  const view = views.get(delta.match);
+  if (!view || delta.seq !== view.seq + 1){
+    //元になる盤面がないので、送信側に盤面全体を送り直してもらう
+    res.status(409).json({message:"keyframe required"})
+    return;
+  }
+  const receivedData = applyDelta(view, delta);
+  storeView(receivedData);
+  if (mainWindow){
+    //差分を適用した盤面をレンダラーへ通知
+    mainWindow.webContents.send("view-message", receivedData);
+    res.status(200).json({message:"successfully"})
+  }else{
+    res.status(200).json({message:"error view not started"})
+  }
+});
+
 http.post('/api/blocksview/result', (req:any, res:any) => {
   const receivedData = req.body;
   if (mainWindow){